@@ -0,0 +1,78 @@
+"""
+Checkpoints of a training run so that it can be resumed
+"""
+import os
+import pickle
+import random
+import shutil
+import sys
+import numpy as np
+
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# folder inside the models path that holds the last checkpoint
+CHECKPOINT_DIR = "checkpoint"
+STATE_FILE = "training_state.pkl"
+
+
+# function to save the model, memory and training state of a run
+def save_checkpoint(path, simulation, episode, epsilon):
+    """
+    The checkpoint is written to a temporary folder first and then replaces the
+    previous one, a crash while saving keeps the previous checkpoint
+    """
+    checkpoint_path = os.path.join(path, CHECKPOINT_DIR)
+    temporary_path = checkpoint_path + "_tmp"
+
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+
+    simulation.Model.save_checkpoint(temporary_path)
+    simulation.Memory.save(temporary_path)
+
+    training_state = {
+        "episode": episode,
+        "epsilon": epsilon,
+        "rewards_list": simulation.rewards_list,
+        "cumulative_wait_time_list": simulation.cumulative_wait_time_list,
+        "average_queue_length_list": simulation.average_queue_length_list,
+        "python_random_state": random.getstate(),
+        "numpy_random_state": np.random.get_state(),
+    }
+    with open(os.path.join(temporary_path, STATE_FILE), "wb") as state_file:
+        pickle.dump(training_state, state_file)
+
+    shutil.rmtree(checkpoint_path, ignore_errors=True)
+    os.replace(temporary_path, checkpoint_path)
+
+    return checkpoint_path
+
+
+# function to restore a run from its last checkpoint
+def load_checkpoint(path, simulation):
+    """
+    Restore the model, memory, stats and random states and return the next
+    episode and its epsilon
+    """
+    checkpoint_path = os.path.join(path, CHECKPOINT_DIR)
+    state_file_path = os.path.join(checkpoint_path, STATE_FILE)
+
+    if not os.path.isfile(state_file_path):
+        sys.exit("Checkpoint not found")
+
+    with open(state_file_path, "rb") as state_file:
+        training_state = pickle.load(state_file)
+
+    simulation.Model.load_checkpoint(checkpoint_path)
+    simulation.Memory.load(checkpoint_path)
+
+    simulation.rewards_list = training_state["rewards_list"]
+    simulation.cumulative_wait_time_list = training_state["cumulative_wait_time_list"]
+    simulation.average_queue_length_list = training_state["average_queue_length_list"]
+
+    random.setstate(training_state["python_random_state"])
+    np.random.set_state(training_state["numpy_random_state"])
+
+    return training_state["episode"], training_state["epsilon"]
@@ -0,0 +1,71 @@
+"""
+Controllers that choose the next green phase of the traffic signal
+"""
+import random
+import numpy as np
+
+import warnings
+
+warnings.filterwarnings("ignore")
+
+
+# DQN agent while training, explores with probability epsilon
+class EpsilonGreedyController:
+
+    # the engine only reads the state for controllers that use it
+    needs_state = True
+
+    def __init__(self, Model, num_actions, epsilon=0.0):
+        self.Model = Model
+        self.num_of_actions = num_actions
+        self.epsilon = epsilon
+
+    def reset(self):
+        pass
+
+    # function to choose action
+    def choose_action(self, state):
+        """
+        This function decides if we will explore or exploit in this step
+        """
+        if random.random() < self.epsilon:
+            action = random.randint(0, self.num_of_actions - 1)
+
+        else:
+            action = np.argmax(self.Model.predict_single(state))
+
+        return action
+
+
+# trained DQN agent, always takes the action with the highest value
+class GreedyController:
+
+    needs_state = True
+
+    def __init__(self, Model):
+        self.Model = Model
+
+    def reset(self):
+        pass
+
+    # function to take action using the trained model
+    def choose_action(self, state):
+        return np.argmax(self.Model.predict_single(state))
+
+
+# pre-timed signal that does not look at the traffic
+class FixedTimeController:
+
+    needs_state = False
+
+    def __init__(self, num_actions=4):
+        self.num_of_actions = num_actions
+        self.old_action = -1
+
+    def reset(self):
+        self.old_action = -1
+
+    # function to perform action as per a clockwise signal pattern
+    def choose_action(self, state):
+        self.old_action = (self.old_action + 1) % self.num_of_actions
+        return self.old_action
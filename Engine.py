@@ -0,0 +1,286 @@
+"""
+Episode loop of the traffic signal shared by the training, test and timed signal runs
+"""
+import timeit
+
+from Tools import start_sumo
+from Observation import INCOMING_EDGES, QueueObserver, QueueOutput
+from Telemetry import CHUNK_SIZE
+
+import warnings
+
+warnings.filterwarnings("ignore")
+
+"""
+    we only have 4 actions that the agent can take which are of turning the
+    lights green because the yellow lights will be the consequence of the
+    decision and they will be the intemediate action that will happen if the
+    traffic light changes from red to green or vice versa
+"""
+# actions
+# action 0 - 00
+NS_GREEN = 0
+NS_YELLOW = 1
+# action 1 - 01
+NSL_GREEN = 2
+NSL_YELLOW = 3
+# action 2 - 10
+EW_GREEN = 4
+EW_YELLOW = 5
+# action 3 - 11
+EWL_GREEN = 6
+EWL_YELLOW = 7
+
+# green phase of every action
+GREEN_PHASES = [NS_GREEN, NSL_GREEN, EW_GREEN, EWL_GREEN]
+
+
+# runs the episodes of one intersection, the controller chooses the actions and
+# the observer reads the state and the wait time, the samples go into Memory and
+# the steps and decisions into telemetry when they are given
+class Engine:
+    def __init__(
+        self,
+        Controller,
+        Observer,
+        Traffic_gen,
+        sumo_cmd,
+        max_steps,
+        green_duration,
+        yellow_duration,
+        label="default",
+        queue_edges=INCOMING_EDGES,
+        step_mode="step",
+        Memory=None,
+        telemetry=None,
+    ):
+        self.Controller = Controller
+        self.Observer = Observer
+        self.Memory = Memory
+        self.telemetry = telemetry
+        self.Traffic_gen = Traffic_gen
+        self.step_count = 0
+        self.sumo_cmd = sumo_cmd
+        self.label = label
+        self.connection = None
+        self.max_steps = max_steps
+        self.yellow_duration = yellow_duration
+        self.green_duration = green_duration
+        self.queue_observer = QueueObserver(queue_edges)
+        self.queue_output = QueueOutput(queue_edges, label)
+
+        # step - sumo is advanced one step at a time to read the queue lengths,
+        # fast_forward - sumo jumps to the end of every phase and the queue
+        # lengths are read from its edge data output at the end of the episode
+        self.step_mode = step_mode
+        self.phase = 0
+
+    def run_episode(self, episode):
+        """
+        Run one episode in sumo with the actions of the controller
+        """
+        start_time = timeit.default_timer()
+
+        self.start_episode(episode)
+
+        while not self.is_done():
+
+            # get current state and save the sample of the previous action
+            current_state = self.observe()
+
+            # choose action based on the current state
+            action = self.choose_action(current_state)
+
+            # take the chosen action
+            self.apply_action(action)
+
+        self.end_episode()
+        simulation_time = round(timeit.default_timer() - start_time, 1)
+
+        return simulation_time
+
+    # function to start sumo and reset the variables of an episode
+    def start_episode(self, episode):
+
+        # setup sumo
+        self.Traffic_gen.create_route(episode)
+        self.connection = start_sumo(
+            self.sumo_cmd + self.Traffic_gen.route_options() + self.queue_options(),
+            self.label,
+        )
+        self.Traffic_gen.inject_route(self.connection)
+        self.Observer.subscribe(self.connection)
+        if self.step_mode == "step":
+            self.queue_observer.subscribe(self.connection)
+
+        # initialize variables in start of episode
+        self.Controller.reset()
+        if self.telemetry is not None:
+            self.telemetry.reset()
+        self.step_count = 0
+        self.sum_queue_length = 0
+        self.sum_waiting_time = 0
+        self.episode_reward = 0
+        self.old_total_wait_time = 0
+        self.current_total_wait = 0
+        self.reward = 0
+        self.old_state = -1
+        self.old_action = -1
+        self.num_step = 0
+
+    # function to check if the episode has reached the last step
+    def is_done(self):
+        return self.step_count >= self.max_steps
+
+    # function to get the current state
+    def observe(self):
+        """
+        Get the current state and the reward of the previous action, the
+        previous state, action, reward and current state are saved into memory
+        """
+        self.Observer.update()
+
+        current_state = None
+        if self.Controller.needs_state:
+            current_state = self.get_state()
+
+        # get reward for previous action
+        self.current_total_wait = self.collect_waiting_times()
+        self.reward = self.old_total_wait_time - self.current_total_wait
+
+        # saving data into memory
+        if self.Memory is not None and self.step_count > 0:
+            self.Memory.add_sample(
+                (self.old_state, self.old_action, self.reward, current_state)
+            )
+
+        # updating the variables for next step
+        self.old_state = current_state
+        self.old_total_wait_time = self.current_total_wait
+        self.episode_reward = self.episode_reward + self.reward
+
+        return current_state
+
+    # function to get the action of the controller
+    def choose_action(self, state):
+        decision_start = timeit.default_timer()
+        action = self.Controller.choose_action(state)
+
+        if self.telemetry is not None:
+            self.telemetry.add_decision(
+                self.step_count,
+                action,
+                self.current_total_wait,
+                self.reward,
+                timeit.default_timer() - decision_start,
+            )
+
+        return action
+
+    # function to run the yellow and green phases of an action
+    def apply_action(self, action):
+
+        # check if the action chosen is different from the last action then activate yellow lights
+        if self.step_count != 0 and action != self.old_action:
+            self.activate_yellow_lights(self.old_action)
+            self.simulate(self.yellow_duration)
+
+        # take the chosen action
+        self.activate_green_lights(action)
+        self.simulate(self.green_duration)
+
+        self.old_action = action
+        self.num_step += 1
+
+    # function to close sumo and collect the queue lengths of the episode
+    def end_episode(self):
+        self.connection.close()
+
+        # the queue lengths of a fast forward episode are in the sumo output, they
+        # are read and streamed one telemetry chunk at a time
+        if self.step_mode == "fast_forward":
+            for first_step, edge_queues in self.queue_output.read_chunks(
+                self.step_count, CHUNK_SIZE
+            ):
+                queue_length = int(edge_queues.sum())
+                self.sum_queue_length += queue_length
+                self.sum_waiting_time += queue_length
+
+                if self.telemetry is not None:
+                    self.telemetry.add_steps(first_step, edge_queues)
+
+        if self.telemetry is not None:
+            self.telemetry.close()
+
+    def get_state(self):
+        return self.Observer.get_state()
+
+    # function to collect cumulative wait time
+    def collect_waiting_times(self):
+        """
+        Get waiting time for every car on the incoming roads
+        """
+        return self.Observer.get_wait_time()
+
+    # function to start yellow light
+    def activate_yellow_lights(self, action):
+        yellow_code = action * 2 + 1
+        self.connection.trafficlight.setPhase("TL", yellow_code)
+        self.phase = yellow_code
+
+    # function to start green light
+    def activate_green_lights(self, action):
+        self.phase = GREEN_PHASES[action]
+        self.connection.trafficlight.setPhase("TL", self.phase)
+
+    # function to get the sumo options of the queue output
+    def queue_options(self):
+        if self.step_mode == "fast_forward":
+            return self.queue_output.options()
+        return []
+
+    # function to get number of cars waiting
+    def get_queue_length(self):
+        """
+        Calculate the total number of cars at speed = 0 on the traced incoming roads
+        """
+        return self.queue_observer.get_queue_length()
+
+    # function to get the stats of the last episode
+    def get_episode_stats(self):
+        return self.episode_reward, self.sum_waiting_time, self.sum_queue_length
+
+    # function to simulate the enviornment on sumo
+    def simulate(self, steps_todo):
+        """
+        Perform steps in sumo
+        """
+        if (self.step_count + steps_todo) >= self.max_steps:
+            steps_todo = self.max_steps - self.step_count
+
+        # jump to the end of the phase with one request
+        if self.step_mode == "fast_forward":
+            if steps_todo > 0:
+                if self.telemetry is not None:
+                    self.telemetry.add_phases(self.phase, steps_todo)
+                self.connection.simulationStep(self.step_count + steps_todo)
+                self.step_count += steps_todo
+            return
+
+        while steps_todo > 0:
+            self.connection.simulationStep()
+            self.step_count += 1
+            steps_todo -= 1
+
+            # the per edge queues are only read when they are streamed
+            if self.telemetry is None:
+                queue_length = self.get_queue_length()
+            else:
+                edge_queues = self.queue_observer.get_edge_queues()
+                queue_length = sum(edge_queues)
+                self.telemetry.add_step(
+                    self.step_count, self.phase, queue_length, edge_queues
+                )
+
+            self.sum_queue_length += queue_length
+            self.sum_waiting_time += queue_length
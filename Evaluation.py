@@ -0,0 +1,139 @@
+"""
+Evaluation of the trained policy over many seeds on several sumo instances
+"""
+import json
+import multiprocessing
+import os
+import numpy as np
+
+from Policy import PolicyRuntime
+from TestSimulation import TestSimulation
+from Traffic import TrafficGenerator
+
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# percentiles of the per-seed results in the report
+PERCENTILES = [5, 50, 95]
+
+# simulation of an evaluation process, created once by the pool initializer, or the
+# error that kept the initializer from creating it
+evaluation_simulation = None
+evaluation_error = None
+
+
+# function to load the policy of an evaluation process
+def load_policy(config):
+    """
+    Policy runtime of the config, used by test_model and loaded once per evaluation
+    process
+    """
+    if config["policy_runtime"] == "numpy":
+        return PolicyRuntime(config["num_states"], config["models_path_name"])
+
+    from Model import TestModel
+
+    return TestModel(
+        config["num_states"], config["models_path_name"], config["inference"]
+    )
+
+
+# function to set up the simulation of an evaluation process
+def init_evaluator(config, sumo_cmd):
+    global evaluation_simulation, evaluation_error
+
+    # the pool restarts a worker that dies in the initializer forever, so a missing
+    # or stale model is raised by the episodes of the worker instead
+    try:
+        policy = load_policy(config)
+    except SystemExit as error:
+        evaluation_error = RuntimeError(str(error.code))
+        return
+
+    label = "eval_%d" % os.getpid()
+    evaluation_simulation = TestSimulation(
+        policy,
+        TrafficGenerator(
+            config["max_steps"],
+            config["n_cars_generated"],
+            os.path.join("environment", "episode_routes_%s.rou.xml" % label),
+            config["route_mode"],
+        ),
+        sumo_cmd,
+        config["max_steps"],
+        config["green_duration"],
+        config["yellow_duration"],
+        config["num_states"],
+        config["num_actions"],
+        label,
+        config["queue_edges"],
+        config["step_mode"],
+        os.path.join(config["test_model_path"], "telemetry", label),
+    )
+
+
+# function to run the test episode of one seed in an evaluation process
+def run_evaluation_episode(seed):
+    if evaluation_error is not None:
+        raise evaluation_error
+
+    simulation_time = evaluation_simulation.run_test(seed)
+    telemetry = evaluation_simulation.telemetry
+
+    return {
+        "seed": seed,
+        "wait_time": float(np.mean(telemetry.read("decisions", "wait_time"))),
+        "queue_length": float(np.mean(telemetry.read("steps", "queue_length"))),
+        "reward": float(np.mean(telemetry.read("decisions", "reward"))),
+        "simulation_time": simulation_time,
+    }
+
+
+# function to aggregate the results of all seeds
+def aggregate(results):
+    """
+    Mean, standard deviation and percentiles across seeds of the per-seed averages
+    """
+    report = {"seeds": len(results)}
+
+    for metric in ["wait_time", "queue_length", "reward"]:
+        values = np.array([result[metric] for result in results])
+        report[metric] = {"mean": float(values.mean()), "std": float(values.std())}
+        for percentile in PERCENTILES:
+            report[metric]["p%d" % percentile] = float(
+                np.percentile(values, percentile)
+            )
+
+    return report
+
+
+# pool of evaluation processes, each one keeps its policy and sumo setup
+class EvaluationPool:
+    def __init__(self, workers, config, sumo_cmd):
+        self.workers = workers
+
+        # spawned workers do not inherit the keras state of the main process
+        context = multiprocessing.get_context("spawn")
+        self.pool = context.Pool(
+            workers, initializer=init_evaluator, initargs=(config, sumo_cmd)
+        )
+
+    def run(self, seeds):
+        """
+        Run one test episode per seed and return their results in seed order
+        """
+        return self.pool.map(run_evaluation_episode, seeds, chunksize=1)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+# function to save the per-seed results and the report as json
+def save_evaluation(path, results, report):
+    evaluation_path = os.path.join(path, "evaluation.json")
+    with open(evaluation_path, "w") as evaluation_file:
+        json.dump({"report": report, "results": results}, evaluation_file, indent=1)
+
+    return evaluation_path
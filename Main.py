@@ -1,15 +1,12 @@
 """
 Main function for starting the Reinforcement Learning
 """
-from Model import TrainingModel, TestModel
-from Memory import Memory
-from Traffic import TrafficGenerator
-from Simulation import Simulation
-from TestSimulation import TestSimulation
-from BaseSimulation import BaseSimulation
 from datetime import datetime
-from Tools import set_config, set_sumo, save_plot
+from Tools import set_config, set_sumo, plot_writer
 import argparse
+import os
+import sys
+import numpy as np
 
 import warnings
 
@@ -20,28 +17,64 @@ def main():
     parser = argparse.ArgumentParser(description="model mode")
 
     parser.add_argument("--mode", "-m", dest="mode", default="2")
+    parser.add_argument("--workers", "-w", dest="workers", type=int, default=1)
+    parser.add_argument("--async", dest="async_learner", action="store_true")
+    parser.add_argument("--envs", "-e", dest="envs", type=int, default=1)
+    parser.add_argument("--resume", dest="resume", action="store_true")
+    parser.add_argument("--profile", dest="profile", action="store_true")
+    parser.add_argument("--seeds", "-s", dest="seeds", type=int, default=1)
 
     args = parser.parse_args()
 
     if args.mode == "1":
         print("training")
-        train_model()
+        train_model(
+            args.workers, args.async_learner, args.envs, args.resume, args.profile
+        )
     elif args.mode == "2":
         print("testing")
-        test_model()
+        test_model(args.profile, args.seeds, args.workers)
     elif args.mode == "3":
         print("training and testing")
-        train_model()
-        test_model()
+        train_model(
+            args.workers, args.async_learner, args.envs, args.resume, args.profile
+        )
+        test_model(args.profile, args.seeds, args.workers)
     elif args.mode == "4":
         print("timed signal")
-        base_model()
+        base_model(args.profile)
+    elif args.mode == "5":
+        print("exporting model weights")
+        export_model()
 
+    # the plots are rendered in the background while the next mode runs
+    plot_writer.close()
+
+
+# every mode imports its own modules, so that keras, traci and matplotlib are only
+# loaded by the modes that use them
+
+
+# function to train model, episodes run on several sumo instances if workers > 1,
+# or in lockstep with batched action selection if envs > 1, resume continues the
+# run from its last checkpoint and profile prints a time breakdown of every episode
+def train_model(workers=1, async_learner=False, envs=1, resume=False, profile=False):
+    from Model import TrainingModel
+    from Memory import create_memory
+    from Rollout import RolloutPool, ActorLearner
+    from VectorSimulation import VectorSimulation
+    from Checkpoint import save_checkpoint, load_checkpoint
+    from Profiler import Profiler
+    from Traffic import TrafficGenerator
+    from Simulation import Simulation
 
-# function to train model
-def train_model():
     config = set_config("config_parameters.txt")
-    sumo_cmd = set_sumo(config["gui"], config["sumocfg_file_name"], config["max_steps"])
+    sumo_cmd = set_sumo(
+        config["gui"],
+        config["sumocfg_file_name"],
+        config["max_steps"],
+        config["backend"],
+    )
     path = config["models_path_name"]
 
     Model = TrainingModel(
@@ -49,9 +82,14 @@ def train_model():
         config["num_actions"],
         config["batch_size"],
         config["learning_rate"],
+        config["inference"],
+    )
+    memory = create_memory(config)
+    Traffic_gen = TrafficGenerator(
+        config["max_steps"],
+        config["n_cars_generated"],
+        route_mode=config["route_mode"],
     )
-    memory = Memory(config["memory_size_min"], config["memory_size_max"])
-    Traffic_gen = TrafficGenerator(config["max_steps"], config["n_cars_generated"])
     simulation = Simulation(
         Model,
         memory,
@@ -64,9 +102,25 @@ def train_model():
         config["num_states"],
         config["num_actions"],
         config["epochs"],
+        queue_edges=config["queue_edges"],
+        step_mode=config["step_mode"],
     )
     episode = 0
 
+    profiler = None
+    if profile:
+        profiler = Profiler()
+        profiler.attach(simulation, "run")
+
+    # episodes run in each round of training
+    round_size = max(workers, envs)
+
+    rollout_pool = None
+    if workers > 1 and not async_learner:
+        rollout_pool = RolloutPool(workers, config, sumo_cmd)
+    elif envs > 1:
+        rollout_pool = VectorSimulation(envs, config, sumo_cmd, Model, memory)
+
     start_time = datetime.now()
     print("Start time: ", start_time.strftime("%Y%m%d_%H%M%S"))
 
@@ -77,34 +131,87 @@ def train_model():
     # in the long run, 10% exploration, 90% exploitation
     epsilon_min = 0.1
 
+    if resume:
+        episode, epsilon = load_checkpoint(path, simulation)
+        print("Resuming from episode: ", episode + 1)
+    last_checkpoint = episode
+
+    if async_learner:
+        # actors and learner run at the same time until all episodes are done
+        epsilons = []
+        for n in range(config["total_episodes"] - episode):
+            epsilons.append(epsilon)
+            epsilon = update_epsilon(epsilon, epsilon_min, epsilon_decay)
+
+        actor_learner = ActorLearner(workers, config, sumo_cmd)
+        wall_time, simulation_time, training_time = actor_learner.run(
+            simulation, episode, epsilons
+        )
+        print("Simulation time: ", simulation_time, "sec")
+        print("Training time: ", training_time, "sec")
+        print("Wall-clock time: ", wall_time, "sec")
+        episode = config["total_episodes"]
+        save_checkpoint(path, simulation, episode, epsilon)
+
     while episode < config["total_episodes"]:
         print("---------------------------------------------------------------------")
-        print("Episode: ", episode + 1)
-        simulation_time, training_time = simulation.run(episode, epsilon)
+        n_episodes = min(round_size, config["total_episodes"] - episode)
+        if n_episodes == 1:
+            print("Episode: ", episode + 1)
+        else:
+            print("Episodes: ", episode + 1, "to", episode + n_episodes)
+
+        epsilons = []
+        for n in range(n_episodes):
+            epsilons.append(epsilon)
+            epsilon = update_epsilon(epsilon, epsilon_min, epsilon_decay)
+
+        if rollout_pool is None:
+            simulation_time, training_time = simulation.run(episode, epsilons[0])
+        else:
+            simulation_time, training_time = rollout_pool.run(
+                simulation, episode, epsilons
+            )
         print("Simulation time: ", simulation_time, "sec")
         print("Training time: ", training_time, "sec")
         print("Total time: ", round(simulation_time + training_time, 1), "sec")
 
-        episode += 1
-        epsilon = update_epsilon(epsilon, epsilon_min, epsilon_decay)
+        episode += n_episodes
+
+        # save a checkpoint every checkpoint_interval episodes and at the end
+        if (
+            episode - last_checkpoint >= config["checkpoint_interval"]
+            or episode == config["total_episodes"]
+        ):
+            checkpoint_path = save_checkpoint(path, simulation, episode, epsilon)
+            print("Checkpoint saved at the path: ", checkpoint_path)
+            last_checkpoint = episode
+
+    if rollout_pool is not None:
+        rollout_pool.close()
 
     Model.save_model(path)
     print("End time: ", datetime.now().strftime("%Y%m%d_%H%M%S"))
     print("Model saved at the path: ", path)
-    save_plot(path, simulation.rewards_list, "reward", "Episode", "Cumulative Reward")
-    save_plot(
+    if profiler is not None:
+        save_profile(profiler, path)
+    plot_writer.save_plots(
         path,
-        simulation.cumulative_wait_time_list,
-        "delay",
-        "Episode",
-        "Cumulative Delay",
-    )
-    save_plot(
-        path,
-        simulation.average_queue_length_list,
-        "queue",
-        "Episode",
-        "Avg queue length",
+        [
+            (simulation.rewards_list, "reward", "Episode", "Cumulative Reward"),
+            (
+                simulation.cumulative_wait_time_list,
+                "delay",
+                "Episode",
+                "Cumulative Delay",
+            ),
+            (
+                simulation.average_queue_length_list,
+                "queue",
+                "Episode",
+                "Avg queue length",
+            ),
+        ],
     )
 
 
@@ -115,16 +222,33 @@ def update_epsilon(epsilon, epsilon_min, epsilon_decay):
     return epsilon
 
 
-# function to test the trained DQN model
-def test_model():
+# function to test the trained DQN model, with seeds > 1 the test episode is run
+# on that many seeds in parallel on up to workers sumo instances
+def test_model(profile=False, seeds=1, workers=1):
+    from Evaluation import load_policy
+    from Profiler import Profiler
+    from Traffic import TrafficGenerator
+    from TestSimulation import TestSimulation
 
     config = set_config("config_parameters.txt")
-    sumo_cmd = set_sumo(config["gui"], config["sumocfg_file_name"], config["max_steps"])
+    sumo_cmd = set_sumo(
+        config["gui"],
+        config["sumocfg_file_name"],
+        config["max_steps"],
+        config["backend"],
+    )
+    if seeds > 1:
+        evaluate_model(config, sumo_cmd, seeds, workers)
+        return
+
     test_path = config["test_model_path"]
-    model_path = config["models_path_name"]
 
-    model = TestModel(config["num_states"], model_path)
-    traffic_gen = TrafficGenerator(config["max_steps"], config["n_cars_generated"])
+    model = load_policy(config)
+    traffic_gen = TrafficGenerator(
+        config["max_steps"],
+        config["n_cars_generated"],
+        route_mode=config["route_mode"],
+    )
 
     simulation = TestSimulation(
         model,
@@ -135,56 +259,115 @@ def test_model():
         config["yellow_duration"],
         config["num_states"],
         config["num_actions"],
+        queue_edges=config["queue_edges"],
+        step_mode=config["step_mode"],
+        telemetry_path=os.path.join(test_path, "telemetry"),
     )
 
+    profiler = None
+    if profile:
+        profiler = Profiler()
+        profiler.attach(simulation, "run_test")
+
     print("Test episode")
 
     simulation_time = simulation.run_test(config["seed"])
     print("Simulation time: ", simulation_time, "sec")
-    save_plot(
-        test_path,
-        simulation.rewards_list,
-        "reward",
-        "steps",
-        "Rewards",
-    )
-    save_plot(
-        test_path,
-        simulation.queue_length_list,
-        "queue length",
-        "steps",
-        "Queue Length",
-    )
-    save_plot(
+
+    rewards = simulation.telemetry.read("decisions", "reward")
+    queue_lengths = simulation.telemetry.read("steps", "queue_length")
+    wait_times = simulation.telemetry.read("decisions", "wait_time")
+    plot_writer.save_plots(
         test_path,
-        simulation.wait_time_list,
-        "Cumulative wait time",
-        "steps",
-        "Wait time",
+        [
+            (rewards, "reward", "steps", "Rewards"),
+            (queue_lengths, "queue length", "steps", "Queue Length"),
+            (wait_times, "Cumulative wait time", "steps", "Wait time"),
+        ],
     )
     print(
         "Average wait time: ",
-        round(sum(simulation.wait_time_list) / len(simulation.wait_time_list), 1),
+        round(float(np.mean(wait_times)), 1),
     )
     print(
         "Average quque length: ",
-        round(sum(simulation.queue_length_list) / len(simulation.queue_length_list), 1),
+        round(float(np.mean(queue_lengths)), 1),
     )
     print(
         "Average reward: ",
-        round(sum(simulation.rewards_list) / len(simulation.rewards_list), 1),
+        round(float(np.mean(rewards)), 1),
     )
     print("Testing results saved at ", test_path)
+    if profiler is not None:
+        save_profile(profiler, test_path)
+
+
+# function to evaluate the trained DQN model on several seeds
+def evaluate_model(config, sumo_cmd, seeds, workers):
+    """
+    The seeds follow the configured seed, every worker loads the policy once
+    """
+    from Evaluation import EvaluationPool, aggregate, load_policy, save_evaluation
+
+    test_path = config["test_model_path"]
+    seed_list = [config["seed"] + n for n in range(seeds)]
+    workers = min(workers if workers > 1 else os.cpu_count(), seeds)
+
+    # a missing or stale model stops the run here instead of in every worker
+    load_policy(config)
+
+    print("Evaluation of", seeds, "seeds on", workers, "workers")
+
+    start_time = datetime.now()
+    evaluation_pool = EvaluationPool(workers, config, sumo_cmd)
+    try:
+        results = evaluation_pool.run(seed_list)
+    except RuntimeError as error:
+        sys.exit(str(error))
+    finally:
+        evaluation_pool.close()
+    wall_time = round((datetime.now() - start_time).total_seconds(), 1)
+
+    report = aggregate(results)
+    print("%-14s %10s %10s %10s %10s %10s" % ("", "mean", "std", "p5", "p50", "p95"))
+    for metric in ["wait_time", "queue_length", "reward"]:
+        print(
+            "%-14s %10.1f %10.1f %10.1f %10.1f %10.1f"
+            % (
+                metric,
+                report[metric]["mean"],
+                report[metric]["std"],
+                report[metric]["p5"],
+                report[metric]["p50"],
+                report[metric]["p95"],
+            )
+        )
+    print("Wall-clock time: ", wall_time, "sec")
+
+    os.makedirs(test_path, exist_ok=True)
+    print("Evaluation saved at ", save_evaluation(test_path, results, report))
 
 
 # test the pre-timed base model
-def base_model():
+def base_model(profile=False):
+    from Profiler import Profiler
+    from Traffic import TrafficGenerator
+    from BaseSimulation import BaseSimulation
 
     config = set_config("config_parameters.txt")
-    sumo_cmd = set_sumo(config["gui"], config["sumocfg_file_name"], config["max_steps"])
+    sumo_cmd = set_sumo(
+        config["gui"],
+        config["sumocfg_file_name"],
+        config["max_steps"],
+        config["backend"],
+    )
     base_path = config["base_model_path"]
 
-    traffic_gen = TrafficGenerator(config["max_steps"], config["n_cars_generated"])
+    traffic_gen = TrafficGenerator(
+        config["max_steps"],
+        config["n_cars_generated"],
+        route_mode=config["route_mode"],
+    )
 
     simulation = BaseSimulation(
         traffic_gen,
@@ -192,36 +375,60 @@ def base_model():
         config["max_steps"],
         config["green_duration"],
         config["yellow_duration"],
+        queue_edges=config["queue_edges"],
+        step_mode=config["step_mode"],
+        telemetry_path=os.path.join(base_path, "telemetry"),
     )
 
+    profiler = None
+    if profile:
+        profiler = Profiler()
+        profiler.attach(simulation, "run_signal")
+
     print("Base timer episode")
 
     simulation_time = simulation.run_signal(config["seed"])
     print("Simulation time: ", simulation_time, "sec")
 
-    save_plot(
-        base_path,
-        simulation.queue_length_list,
-        "queue length",
-        "steps",
-        "Queue Length",
-    )
-    save_plot(
+    queue_lengths = simulation.telemetry.read("steps", "queue_length")
+    wait_times = simulation.telemetry.read("decisions", "wait_time")
+
+    plot_writer.save_plots(
         base_path,
-        simulation.wait_time_list,
-        "Cumulative wait time",
-        "steps",
-        "Wait time",
+        [
+            (queue_lengths, "queue length", "steps", "Queue Length"),
+            (wait_times, "Cumulative wait time", "steps", "Wait time"),
+        ],
     )
     print(
         "Average wait time: ",
-        round(sum(simulation.wait_time_list) / len(simulation.wait_time_list), 1),
+        round(float(np.mean(wait_times)), 1),
     )
     print(
         "Average quque length: ",
-        round(sum(simulation.queue_length_list) / len(simulation.queue_length_list), 1),
+        round(float(np.mean(queue_lengths)), 1),
     )
     print("Testing results saved at ", base_path)
+    if profiler is not None:
+        save_profile(profiler, base_path)
+
+
+# function to write the profile of a run next to its results
+def save_profile(profiler, path):
+    profiler.detach()
+    profile_path = os.path.join(path, "profile.json")
+    profiler.export(profile_path)
+    print("Profile saved at ", profile_path)
+
+
+# export the trained model weights for the numpy policy runtime
+def export_model():
+    from Policy import export_weights
+
+    config = set_config("config_parameters.txt")
+    weights_path = export_weights(config["models_path_name"])
+    print("Model weights exported at ", weights_path)
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -2,37 +2,419 @@
 Code for Memory creation and related functions
 
 """
+import os
 import random
+import numpy as np
 import warnings
 
 warnings.filterwarnings("ignore")
 
-# Memory is the list of samples
+# arrays of the memory saved in a checkpoint
+MEMORY_ARRAYS = [
+    "state_store",
+    "state_index",
+    "next_state_index",
+    "actions",
+    "rewards",
+    "slot_reference",
+]
+
+# compact dtypes of the stored samples, a cell holds at most a few dozen cars
+STATE_DTYPE = np.uint8
+INDEX_DTYPE = np.int32
+ACTION_DTYPE = np.int8
+REWARD_DTYPE = np.float32
+
+# number of recently stored states that a new sample can point to
+RECENT_STATES = 64
+
+# prioritized replay, priorities are |td error| + PRIORITY_EPSILON raised to alpha
+PRIORITY_EPSILON = 0.01
+
+
+# function to create the memory selected in the config
+def create_memory(config):
+    if config["memory_type"] == "disk":
+        return DiskMemory(
+            config["memory_size_min"],
+            config["memory_size_max"],
+            config["memory_path"],
+        )
+    elif config["memory_type"] == "prioritized":
+        # the importance sampling exponent beta reaches 1 with the last batch of
+        # the training, every episode replays epochs batches
+        beta_step = (1 - config["priority_beta"]) / (
+            config["total_episodes"] * config["epochs"]
+        )
+        return PrioritizedMemory(
+            config["memory_size_min"],
+            config["memory_size_max"],
+            config["priority_alpha"],
+            config["priority_beta"],
+            beta_step,
+        )
+
+    return Memory(config["memory_size_min"], config["memory_size_max"])
+
+
+# Memory is a circular buffer of samples kept in preallocated arrays, the states
+# are kept once in a circular state store and the samples point to them
 class Memory:
     def __init__(self, min_size, max_size):
 
-        self.sample_list = []
         self.min_size = min_size
         self.max_size = max_size
+        # a sample writes one state, its next state, and only points to states
+        # written less than RECENT_STATES writes ago. The state of the first sample
+        # of an episode is written too, the oldest samples are evicted for these
+        # few extra writes when the store wraps
+        self.state_capacity = max_size + RECENT_STATES
+
+        # arrays are allocated with the shape of the first sample
+        self.state_store = None
+        self.state_index = None
+        self.next_state_index = None
+        self.actions = None
+        self.rewards = None
+
+        # last sample that points to each state slot
+        self.slot_reference = None
+
+        # position of the next write, number of stored samples and number of
+        # samples added so far
+        self.head = 0
+        self.size = 0
+        self.count = 0
+
+        # position of the next state write and number of states written so far
+        self.state_head = 0
+        self.state_writes = 0
+
+        # recently stored states by content -> (slot, write number)
+        self.recent_states = {}
+
+        # importance sampling weights of the last batch, None for uniform sampling
+        self.weights = None
+
+    def allocate(self, state):
+
+        shape = (self.state_capacity,) + np.shape(state)
+
+        self.state_store = self.create_array("state_store", STATE_DTYPE, shape)
+        self.state_index = self.create_array(
+            "state_index", INDEX_DTYPE, (self.max_size,)
+        )
+        self.next_state_index = self.create_array(
+            "next_state_index", INDEX_DTYPE, (self.max_size,)
+        )
+        self.actions = self.create_array("actions", ACTION_DTYPE, (self.max_size,))
+        self.rewards = self.create_array("rewards", REWARD_DTYPE, (self.max_size,))
+        self.slot_reference = self.create_array(
+            "slot_reference", np.int64, (self.state_capacity,)
+        )
+        self.slot_reference[:] = -1
+
+    # function to create one array of the memory
+    def create_array(self, name, dtype, shape):
+        return np.zeros(shape, dtype=dtype)
 
     def add_sample(self, sample):
 
-        self.sample_list.append(sample)
+        state, action, reward, next_state = sample
 
-        # if the sample list is full then empty an older value
-        if self.current_size() > self.max_size:
-            self.sample_list.pop(0)
+        if self.state_store is None:
+            self.allocate(state)
 
-    def get_samples(self, batch_size):
+        # if the buffer is full then the oldest sample is overwritten
+        if self.size == self.max_size:
+            self.evict(1)
 
-        samples = []
+        state_slot = self.store_state(state)
+        next_state_slot = self.store_state(next_state)
+
+        self.state_index[self.head] = state_slot
+        self.next_state_index[self.head] = next_state_slot
+        self.actions[self.head] = action
+        self.rewards[self.head] = reward
+        self.slot_reference[state_slot] = self.count
+        self.slot_reference[next_state_slot] = self.count
+
+        self.head = (self.head + 1) % self.max_size
+        self.size += 1
+        self.count += 1
+
+    # function to get the slot of a state in the state store
+    def store_state(self, state):
+        """
+        The next state of a sample is the state of the following one, a state
+        that was stored recently is not stored again
+        """
+        state = np.asarray(state).astype(STATE_DTYPE)
+        key = state.tobytes()
+
+        if key in self.recent_states:
+            slot, write_number = self.recent_states[key]
+            if self.state_writes - write_number < RECENT_STATES:
+                return slot
+
+        # the oldest state is overwritten, the samples that still point to it are
+        # the oldest ones in the buffer and are evicted
+        slot = self.state_head
+        evicted = self.slot_reference[slot] - (self.count - self.size) + 1
+        if evicted > 0:
+            self.evict(evicted)
+
+        self.state_store[slot] = state
+        self.recent_states[key] = (slot, self.state_writes)
+        if len(self.recent_states) > RECENT_STATES:
+            del self.recent_states[next(iter(self.recent_states))]
+
+        self.state_head = (self.state_head + 1) % self.state_capacity
+        self.state_writes += 1
+
+        return slot
+
+    # function to drop the oldest samples
+    def evict(self, n_samples):
+        self.size -= n_samples
+
+    # function to get the buffer positions of the oldest samples
+    def positions(self, offsets):
+        return (self.head - self.size + offsets) % self.max_size
+
+    def get_samples(self, batch_size):
+        """
+        Return a batch as (states, actions, rewards, next_states) arrays,
+        or an empty tuple while the memory holds too few samples
+        """
+        samples = ()
         if self.current_size() > self.min_size:
             if batch_size > self.current_size():
-                samples = self.sample_list
+                offsets = np.arange(self.size)
             else:
-                samples = random.sample(self.sample_list, batch_size)
+                offsets = np.array(random.sample(range(self.size), batch_size))
+
+            samples = self.gather(self.positions(offsets))
 
         return samples
 
+    # function to read the samples at some buffer positions
+    def gather(self, indices):
+        """
+        The states are expanded to float32 only here
+        """
+        return (
+            self.state_store[self.state_index[indices]].astype(np.float32),
+            self.actions[indices].astype(np.int64),
+            self.rewards[indices],
+            self.state_store[self.next_state_index[indices]].astype(np.float32),
+        )
+
     def current_size(self):
-        return len(self.sample_list)
+        return self.size
+
+    def update_priorities(self, td_errors):
+        """
+        Uniform sampling does not use the td errors of the last batch
+        """
+        pass
+
+    def nbytes(self):
+        """
+        Bytes held by the sample arrays, fixed once the first sample is added
+        """
+        if self.state_store is None:
+            return 0
+
+        return sum(getattr(self, name).nbytes for name in MEMORY_ARRAYS)
+
+    def save(self, path):
+        """
+        Save the arrays as .npy files and the buffer position
+        """
+        np.save(
+            os.path.join(path, "memory_position.npy"),
+            [self.head, self.size, self.count, self.state_head, self.state_writes],
+        )
+        if self.state_store is None:
+            return
+
+        for name in MEMORY_ARRAYS:
+            np.save(os.path.join(path, "memory_%s.npy" % name), getattr(self, name))
+
+    def load(self, path):
+        """
+        Restore the samples saved by save, the files are memory-mapped and copied
+        into the buffer without an extra copy in between
+        """
+        position = np.load(os.path.join(path, "memory_position.npy"))
+        self.head, self.size, self.count, self.state_head, self.state_writes = [
+            int(value) for value in position
+        ]
+        self.recent_states = {}
+        if self.count == 0:
+            return
+
+        arrays = {
+            name: np.load(os.path.join(path, "memory_%s.npy" % name), mmap_mode="r")
+            for name in MEMORY_ARRAYS
+        }
+
+        self.allocate(arrays["state_store"][0])
+        for name in MEMORY_ARRAYS:
+            getattr(self, name)[:] = arrays[name]
+
+
+# Memory with its arrays memory-mapped to files, so that the number of samples
+# is limited by the disk instead of the RAM
+class DiskMemory(Memory):
+    def __init__(self, min_size, max_size, memory_path):
+        super().__init__(min_size, max_size)
+        self.memory_path = memory_path
+
+    # function to create one memory-mapped array
+    def create_array(self, name, dtype, shape):
+        """
+        The files are sparse until the samples are written
+        """
+        os.makedirs(self.memory_path, exist_ok=True)
+        return np.memmap(
+            os.path.join(self.memory_path, name + ".dat"),
+            dtype=dtype,
+            mode="w+",
+            shape=shape,
+        )
+
+    def gather(self, indices):
+        """
+        Same as Memory.gather with the samples read in file order
+        """
+        return super().gather(np.sort(indices))
+
+
+# binary tree over the priorities where every node holds the sum of its
+# children, the leaves are kept in the second half of the array
+class SumTree:
+    def __init__(self, capacity):
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.depth = self.leaves.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaves)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, indices):
+        return self.tree[indices + self.leaves]
+
+    def update(self, indices, priorities):
+        """
+        Set the priorities of the given leaves and then recompute their parents,
+        one level at a time for the whole batch
+        """
+        nodes = np.asarray(indices) + self.leaves
+        self.tree[nodes] = priorities
+
+        for level in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        Return the leaf of every value in [0, total), descending the tree for
+        the whole batch at once
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+
+        for level in range(self.depth):
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values -= self.tree[left] * go_right
+            nodes = left + go_right
+
+        return nodes - self.leaves
+
+
+# Memory that samples the transitions with a large td error more often
+class PrioritizedMemory(Memory):
+    def __init__(self, min_size, max_size, alpha, beta, beta_step):
+        super().__init__(min_size, max_size)
+        self.alpha = alpha
+        self.beta = beta
+        # beta grows by beta_step every batch
+        self.beta_step = beta_step
+
+        self.tree = SumTree(max_size)
+        self.max_priority = 1.0
+
+        # indices of the last batch, their priorities are updated after training
+        self.indices = None
+
+    def add_sample(self, sample):
+
+        # new samples get the highest priority so that they are replayed at least once
+        position = self.head
+        super().add_sample(sample)
+        self.tree.update([position], [self.max_priority])
+
+    def evict(self, n_samples):
+
+        # evicted samples can no longer be drawn
+        self.tree.update(self.positions(np.arange(n_samples)), 0)
+        super().evict(n_samples)
+
+    def get_samples(self, batch_size):
+        """
+        Same as Memory.get_samples, the batch is drawn in proportion to the
+        priorities and their importance sampling weights are kept in weights
+        """
+        samples = ()
+        if self.current_size() > self.min_size:
+            batch_size = min(batch_size, self.current_size())
+
+            # one sample from each of batch_size equal segments of the total
+            segment = self.tree.total() / batch_size
+            values = (np.arange(batch_size) + np.random.random(batch_size)) * segment
+            indices = self.tree.find(values)
+
+            # a value rounded onto an empty leaf takes the newest sample instead
+            self.indices = np.where(
+                self.tree.get(indices) > 0, indices, (self.head - 1) % self.max_size
+            )
+
+            probabilities = self.tree.get(self.indices) / self.tree.total()
+            weights = (self.size * probabilities) ** -self.beta
+            self.weights = weights / weights.max()
+
+            samples = self.gather(self.indices)
+
+        # beta also grows while the memory is filling, so it reaches 1 with the last
+        # batch of the training
+        self.beta = min(1.0, self.beta + self.beta_step)
+
+        return samples
+
+    def update_priorities(self, td_errors):
+        """
+        Set the priorities of the last batch from its td errors
+        """
+        priorities = (np.abs(td_errors) + PRIORITY_EPSILON) ** self.alpha
+        self.tree.update(self.indices, priorities)
+        self.max_priority = max(self.max_priority, priorities.max())
+
+    def save(self, path):
+        super().save(path)
+        np.save(os.path.join(path, "memory_priorities.npy"), self.tree.tree)
+        np.save(
+            os.path.join(path, "memory_priority_state.npy"),
+            [self.max_priority, self.beta],
+        )
+
+    def load(self, path):
+        super().load(path)
+        self.tree.tree = np.load(os.path.join(path, "memory_priorities.npy"))
+        priority_state = np.load(os.path.join(path, "memory_priority_state.npy"))
+        self.max_priority = float(priority_state[0])
+        self.beta = float(priority_state[1])
@@ -5,6 +5,7 @@ import numpy as np
 import keras
 from keras import layers, optimizers, Input
 from keras.models import load_model
+from Policy import DenseForward, export_weights
 import os
 import sys
 import warnings
@@ -13,13 +14,19 @@ warnings.filterwarnings("ignore")
 
 # deep neural network model
 class TrainingModel:
-    def __init__(self, input_dim, output_dim, batch_size, learning_rate):
+    def __init__(
+        self, input_dim, output_dim, batch_size, learning_rate, inference="predict"
+    ):
 
         # hyperparameters
         self.input_dim = input_dim
         self.output_dim = output_dim
         self.batch_size = batch_size
         self.learning_rate = learning_rate
+        self.inference = inference
+
+        # numpy copy of the weights, rebuilt after the weights change
+        self.forward = None
 
         # now build and compile the model
         inputs = Input(shape=(self.input_dim,))
@@ -43,28 +50,51 @@ class TrainingModel:
 
         # predict action value for a single state
         state = np.reshape(state, [1, self.input_dim])
-        return self.model.predict(state)
+        return predict_state(self, state)
 
     def predict_batch(self, states):
 
-        # predict action values for a bacth of states
-        return self.model.predict(states)
+        # predict action values for a bacth of states in a single call
+        return self.model.predict_on_batch(states)
+
+    def get_weights(self):
 
-    def train_model(self, input_states, target_q_s_a):
+        # current weights as a list of numpy arrays
+        return self.model.get_weights()
 
-        # train the model
-        self.model.fit(input_states, target_q_s_a, epochs=1, verbose=0)
+    def train_model(self, input_states, target_q_s_a, sample_weights=None):
+
+        # train the model with one gradient step over the whole batch,
+        # weighted by the importance sampling weights of a prioritized batch
+        self.model.train_on_batch(
+            input_states, target_q_s_a, sample_weight=sample_weights
+        )
+        self.forward = None
 
     def save_model(self, path):
 
-        # Save the current model
+        # Save the current model and export its weights for the numpy policy runtime
         self.model.save(os.path.join(path, "trained_model.h5"))
+        export_weights(path)
+
+    def save_checkpoint(self, path):
+
+        # the saved model also holds the optimizer state
+        self.model.save(os.path.join(path, "checkpoint_model.h5"))
+
+    def load_checkpoint(self, path):
+
+        # continue training with the saved weights and optimizer state
+        self.model = load_model(os.path.join(path, "checkpoint_model.h5"))
+        self.forward = None
 
 
 # class for testing the trained model
 class TestModel:
-    def __init__(self, input_dim, model_path):
+    def __init__(self, input_dim, model_path, inference="predict"):
         self.input_dim = input_dim
+        self.inference = inference
+        self.forward = None
         self.model = self.load_trained_model(model_path)
 
     def load_trained_model(self, model_path):
@@ -78,4 +108,20 @@ class TestModel:
 
     def predict_single(self, state):
         state = np.reshape(state, [1, self.input_dim])
-        return self.model.predict(state)
+        return predict_state(self, state)
+
+
+# function to predict with the inference path selected in the config
+def predict_state(network, state):
+    """
+    predict - keras predict, direct - single call without the predict loop,
+    numpy - forward pass over a numpy copy of the weights
+    """
+    if network.inference == "numpy":
+        if network.forward is None:
+            network.forward = DenseForward(network.model.get_weights())
+        return network.forward.predict(state)
+    elif network.inference == "direct":
+        return network.model.predict_on_batch(state)
+    else:
+        return network.model.predict(state)
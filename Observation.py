@@ -0,0 +1,276 @@
+"""
+Observation of the incoming roads of the intersection using TraCI subscriptions
+"""
+import os
+import xml.etree.ElementTree as ET
+import numpy as np
+import traci.constants as tc
+
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# incoming roads of the intersection
+INCOMING_EDGES = ["W2TL", "N2TL", "E2TL", "S2TL"]
+
+# incoming lanes, the position of a lane in this list is its cell prefix in the state
+INCOMING_LANES = [
+    "W2TL_0",
+    "W2TL_1",
+    "N2TL_0",
+    "N2TL_1",
+    "E2TL_0",
+    "E2TL_1",
+    "S2TL_0",
+    "S2TL_1",
+]
+
+# lookup table from lane id to cell prefix, other lanes map to -1
+LANE_INDEX = {lane_id: index for index, lane_id in enumerate(INCOMING_LANES)}
+
+# length of the incoming lanes and the upper distance bound of each cell,
+# cell 0 is the one nearest to the traffic light
+LANE_LENGTH = 750
+CELL_BOUNDARIES = np.array([8, 16, 32, 64, 128, 256, 330, 500, 630, 750])
+CELLS_PER_LANE = len(CELL_BOUNDARIES)
+
+# size of the occupancy state, one value per cell of every incoming lane
+NUM_STATES = len(INCOMING_LANES) * CELLS_PER_LANE
+
+# distance around the edge shape covered by the context subscription,
+# vehicles picked up on the junction are filtered out by their lane id
+CONTEXT_RANGE = 1.0
+
+
+class StateObserver:
+    def __init__(self, incoming_edges=INCOMING_EDGES):
+        self.incoming_edges = incoming_edges
+        self.connection = None
+        self.vehicles = {}
+
+    # function to subscribe to the vehicles on the incoming roads
+    def subscribe(self, connection):
+        """
+        Subscribe to the lane id, lane position and accumulated waiting time of every
+        vehicle on the incoming roads, sumo then sends all of them with the response
+        of every simulation step
+        """
+        self.connection = connection
+
+        for edge_id in self.incoming_edges:
+            connection.edge.subscribeContext(
+                edge_id,
+                tc.CMD_GET_VEHICLE_VARIABLE,
+                CONTEXT_RANGE,
+                [
+                    tc.VAR_LANE_ID,
+                    tc.VAR_LANEPOSITION,
+                    tc.VAR_ACCUMULATED_WAITING_TIME,
+                ],
+            )
+
+    # function to read the subscribed vehicle values of the last step
+    def update(self):
+        """
+        Merge the results of the incoming roads into a dict of vehicle id ->
+        subscribed values, done once per step for the state and the wait time
+        """
+        vehicles = {}
+
+        for edge_id in self.incoming_edges:
+            results = self.connection.edge.getContextSubscriptionResults(edge_id)
+            if results:
+                vehicles.update(results)
+
+        self.vehicles = vehicles
+        return vehicles
+
+    # function to get the vehicle values read by the last update
+    def get_vehicles(self):
+        return self.vehicles
+
+    # function to get lane index and lane position arrays of the last step
+    def get_lane_positions(self):
+        """
+        Return the cell prefix and the lane position of every observed vehicle
+        """
+        vehicles = self.get_vehicles().values()
+
+        lane_indices = np.fromiter(
+            (LANE_INDEX.get(car_data[tc.VAR_LANE_ID], -1) for car_data in vehicles),
+            dtype=np.int64,
+            count=len(vehicles),
+        )
+        lane_positions = np.fromiter(
+            (car_data[tc.VAR_LANEPOSITION] for car_data in vehicles),
+            dtype=np.float64,
+            count=len(vehicles),
+        )
+
+        return lane_indices, lane_positions
+
+
+# reads the halting counts of the traced edges from an edge subscription
+class QueueObserver:
+    def __init__(self, queue_edges=INCOMING_EDGES):
+        self.queue_edges = queue_edges
+        self.connection = None
+
+    # function to subscribe to the halting count of the traced edges
+    def subscribe(self, connection):
+        """
+        The halting counts of all traced edges then come with the response of
+        every simulation step instead of one request per edge and step
+        """
+        self.connection = connection
+
+        for edge_id in self.queue_edges:
+            connection.edge.subscribe(edge_id, [tc.LAST_STEP_VEHICLE_HALTING_NUMBER])
+
+    # function to get the number of halting cars of the last step
+    def get_queue_length(self):
+        """
+        Total number of cars at speed = 0 on the traced edges, 0 if no edge is traced
+        """
+        return sum(self.get_edge_queues())
+
+    # function to get the number of halting cars of each traced edge
+    def get_edge_queues(self):
+        return [
+            self.connection.edge.getSubscriptionResults(edge_id)[
+                tc.LAST_STEP_VEHICLE_HALTING_NUMBER
+            ]
+            for edge_id in self.queue_edges
+        ]
+
+
+# reads the halting counts of the traced edges from the edge data output of sumo
+class QueueOutput:
+    def __init__(self, queue_edges=INCOMING_EDGES, label="default"):
+        self.queue_edges = queue_edges
+
+        # sumo writes the output next to the additional file
+        self.additional_file = os.path.join("environment", "queue_%s.add.xml" % label)
+        self.output_file = os.path.join("environment", "queue_%s.out.xml" % label)
+
+    # function to get the sumo options that write the edge data output
+    def options(self):
+        """
+        Write the additional file that defines the edge data output, with a period
+        of one step the waiting time of an edge in an interval is the number of
+        cars halting on it in that step
+        """
+        if not self.queue_edges:
+            return []
+
+        with open(self.additional_file, "w") as additional:
+            additional.write(
+                "<additional>\n"
+                '    <edgeData id="queue" file="%s" period="1" edges="%s" '
+                'writeAttributes="waitingTime"/>\n'
+                "</additional>\n"
+                % (os.path.basename(self.output_file), " ".join(self.queue_edges))
+            )
+
+        return ["--additional-files", self.additional_file]
+
+    # function to read the halting counts of each traced edge once sumo has closed
+    def read_chunks(self, steps, chunk_size):
+        """
+        Yield the first step and an array with one row per step and one column per
+        traced edge for every chunk_size steps, so that the queues of a long
+        episode are never held at once
+        """
+        intervals = self.read_intervals()
+        pending = next(intervals, None)
+
+        for first_step in range(0, steps, chunk_size):
+            last_step = min(first_step + chunk_size, steps)
+            edge_queues = np.zeros(
+                (last_step - first_step, len(self.queue_edges)), dtype=np.int64
+            )
+            while pending is not None and pending[0] < last_step:
+                step, values = pending
+                edge_queues[step - first_step] = values
+                pending = next(intervals, None)
+
+            yield first_step, edge_queues
+
+    # function to read the halting counts of the traced edges one step at a time
+    def read_intervals(self):
+        if not self.queue_edges:
+            return
+
+        columns = {edge_id: column for column, edge_id in enumerate(self.queue_edges)}
+        root = None
+        for event, element in ET.iterparse(self.output_file, events=("start", "end")):
+            if root is None:
+                root = element
+            if event != "end" or element.tag != "interval":
+                continue
+
+            values = np.zeros(len(self.queue_edges), dtype=np.int64)
+            for edge in element:
+                values[columns[edge.get("id")]] = round(
+                    float(edge.get("waitingTime", 0))
+                )
+            yield int(float(element.get("begin"))), values
+
+            # the parsed intervals are dropped from the tree
+            root.clear()
+
+
+# function to get the cumulative wait time of the cars on the incoming roads
+def total_waiting_time(vehicles):
+    """
+    Sum of the accumulated waiting times of the observed cars on the incoming lanes,
+    the cars on the junction are left out
+    """
+    return sum(
+        car_data[tc.VAR_ACCUMULATED_WAITING_TIME]
+        for car_data in vehicles.values()
+        if car_data[tc.VAR_LANE_ID] in LANE_INDEX
+    )
+
+
+# function to encode vehicle positions into the occupancy state
+def encode_state(lane_indices, lane_positions, num_states):
+    """
+    Count the vehicles in every cell, a cell is lane index * 10 + distance cell
+    """
+    # cars that are crossing or have crossed the intersection are not valid
+    valid = lane_indices >= 0
+
+    # manipulating the value so that the nearest car near the traffic light has position 0
+    distances = LANE_LENGTH - lane_positions[valid]
+
+    cell_no = np.searchsorted(CELL_BOUNDARIES, distances, side="right")
+    cell_no = np.minimum(cell_no, CELLS_PER_LANE - 1)
+    car_cells = lane_indices[valid] * CELLS_PER_LANE + cell_no
+
+    state = np.bincount(car_cells, minlength=num_states)
+    return state.astype(np.float64)
+
+
+# observation backend of the engine, the occupancy state and the cumulative wait
+# time of the incoming roads both come from the context subscription
+class LaneObserver:
+    def __init__(self, num_states=NUM_STATES, incoming_edges=INCOMING_EDGES):
+        self.num_states = num_states
+        self.state_observer = StateObserver(incoming_edges)
+
+    # function to subscribe to the vehicles of a new connection
+    def subscribe(self, connection):
+        self.state_observer.subscribe(connection)
+
+    # function to read the vehicles once before the state and the wait time
+    def update(self):
+        self.state_observer.update()
+
+    def get_state(self):
+        lane_indices, lane_positions = self.state_observer.get_lane_positions()
+        return encode_state(lane_indices, lane_positions, self.num_states)
+
+    # function to get the cumulative wait time of the cars on the incoming roads
+    def get_wait_time(self):
+        return total_waiting_time(self.state_observer.get_vehicles())
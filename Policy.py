@@ -0,0 +1,119 @@
+"""
+NumPy forward pass and runtime of the dense action value network
+"""
+import numpy as np
+import os
+import sys
+import warnings
+
+warnings.filterwarnings("ignore")
+
+MODEL_FILE = "trained_model.h5"
+WEIGHTS_FILE = "trained_model.npz"
+
+# forward pass of a relu MLP with a linear output layer
+class DenseForward:
+    def __init__(self, weights):
+
+        # weights in the keras get_weights order, kernel and bias for each layer
+        self.kernels = [np.asarray(w, dtype=np.float32) for w in weights[0::2]]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in weights[1::2]]
+
+    def predict(self, states):
+
+        # predict action values for a batch of states
+        x = np.asarray(states, dtype=np.float32)
+
+        for kernel, bias in zip(self.kernels[:-1], self.biases[:-1]):
+            x = np.maximum(x @ kernel + bias, 0)
+
+        return x @ self.kernels[-1] + self.biases[-1]
+
+
+# policy that only needs numpy to run the trained model
+class PolicyRuntime:
+    def __init__(self, input_dim, model_path=None):
+        self.input_dim = input_dim
+        self.forward = None
+
+        if model_path is not None:
+            self.forward = self.load_weights(model_path)
+
+    def set_weights(self, weights):
+
+        # use weights handed over from a keras model, e.g. by the training process
+        self.forward = DenseForward(weights)
+
+    def load_weights(self, model_path):
+        weights_file_path = os.path.join(model_path, WEIGHTS_FILE)
+        model_file_path = os.path.join(model_path, MODEL_FILE)
+
+        # the weights are exported from the model when they are missing or were
+        # exported before the model was last trained, which only needs h5py
+        if os.path.isfile(model_file_path) and (
+            not os.path.isfile(weights_file_path)
+            or os.path.getmtime(weights_file_path) < os.path.getmtime(model_file_path)
+        ):
+            export_weights(model_path)
+
+        if os.path.isfile(weights_file_path):
+            with np.load(weights_file_path) as weights_file:
+                weights = [
+                    weights_file[name] for name in layer_array_names(weights_file)
+                ]
+            return DenseForward(weights)
+        else:
+            sys.exit("Model not found")
+
+    def predict_single(self, state):
+        state = np.reshape(state, [1, self.input_dim])
+        return self.forward.predict(state)
+
+
+# function to export the weights of the trained keras model
+def export_weights(model_path):
+    """
+    Read the layer weights from the keras .h5 file and save them as a compact .npz
+    """
+    import h5py
+
+    model_file_path = os.path.join(model_path, MODEL_FILE)
+    if not os.path.isfile(model_file_path):
+        sys.exit("Model not found")
+
+    arrays = {}
+    with h5py.File(model_file_path, "r") as model_file:
+        model_weights = model_file["model_weights"]
+
+        # layers are stored in model order, layers without weights are skipped
+        layer_index = 0
+        for layer_name in model_weights.attrs["layer_names"]:
+            layer = model_weights[as_text(layer_name)]
+            weight_names = [as_text(name) for name in layer.attrs["weight_names"]]
+            if len(weight_names) == 0:
+                continue
+
+            for weight_name in weight_names:
+                kind = "kernel" if "kernel" in weight_name else "bias"
+                arrays["%s_%d" % (kind, layer_index)] = np.asarray(
+                    layer[weight_name], dtype=np.float32
+                )
+            layer_index += 1
+
+    weights_file_path = os.path.join(model_path, WEIGHTS_FILE)
+    np.savez(weights_file_path, **arrays)
+    return weights_file_path
+
+
+def as_text(name):
+    return name.decode("utf8") if isinstance(name, bytes) else name
+
+
+# function to order the saved arrays as kernel, bias for each layer
+def layer_array_names(weights_file):
+    n_layers = len(weights_file.files) // 2
+    names = []
+    for layer_index in range(n_layers):
+        names.append("kernel_%d" % layer_index)
+        names.append("bias_%d" % layer_index)
+    return names
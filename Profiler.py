@@ -0,0 +1,229 @@
+"""
+Timers, TraCI call counters and latency histograms for the hot paths of a simulation
+"""
+import bisect
+import json
+import timeit
+import numpy as np
+
+import Tools
+
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# methods of the simulations and models that are timed when they exist,
+# simulate includes the sumo steps and choose_action includes the prediction
+SIMULATION_SECTIONS = [
+    "get_state",
+    "collect_waiting_times",
+    "simulate",
+    "choose_action",
+    "replay",
+]
+MODEL_SECTIONS = ["predict_single", "predict_batch", "train_model"]
+
+# methods of the traci domains that read the subscription results sent with the last
+# step, they do not go through the socket and are counted apart from the traci calls
+CACHED_READS = [
+    "getSubscriptionResults",
+    "getContextSubscriptionResults",
+    "getAllSubscriptionResults",
+    "getAllContextSubscriptionResults",
+]
+
+# upper bounds of the latency histogram in seconds, 5 bins per decade from 1 us to 100 s
+HISTOGRAM_BOUNDS = np.logspace(-6, 2, 41)
+
+
+# count, total time and latency histogram of one section
+class Timer:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def record(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS, elapsed)] += 1
+
+    # function to get the latency below which a share of the calls fall
+    def percentile(self, share):
+        """
+        Upper bound of the histogram bin that holds the percentile
+        """
+        cumulative = np.cumsum(self.histogram)
+        index = int(np.searchsorted(cumulative, share * self.count))
+        return float(HISTOGRAM_BOUNDS[min(index, len(HISTOGRAM_BOUNDS) - 1)])
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total": round(self.total, 6),
+            "mean": round(self.total / self.count, 9) if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "histogram": self.histogram,
+        }
+
+
+# collects the timers of the attached simulation, nothing is wrapped unless a
+# simulation is attached so there is no cost when profiling is off
+class Profiler:
+    def __init__(self):
+        self.sections = {}
+        self.traci_calls = {}
+        self.cached_reads = {}
+        self.episodes = []
+
+    # function to time the sections of a simulation and the traci calls
+    def attach(self, simulation, episode_method):
+        """
+        Wrap the sections of the simulation and its model, and print a breakdown
+        after every call of episode_method
+        """
+        for name in SIMULATION_SECTIONS:
+            if hasattr(simulation, name):
+                self.wrap(simulation, name, self.timer(self.sections, name))
+
+        model = getattr(simulation, "Model", None)
+        for name in MODEL_SECTIONS:
+            if hasattr(model, name):
+                self.wrap(model, name, self.timer(self.sections, name))
+
+        episode = getattr(simulation, episode_method)
+
+        def run_and_report(*args, **kwargs):
+            result = episode(*args, **kwargs)
+            self.report()
+            return result
+
+        setattr(simulation, episode_method, run_and_report)
+        Tools.connection_hooks.append(self.count_calls)
+
+    # function to stop counting the traci calls of new connections
+    def detach(self):
+        if self.count_calls in Tools.connection_hooks:
+            Tools.connection_hooks.remove(self.count_calls)
+
+    def timer(self, timers, name):
+        if name not in timers:
+            timers[name] = Timer()
+        return timers[name]
+
+    # function to replace a method of an object by a timed one
+    def wrap(self, owner, name, timer):
+        method = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            start = timeit.default_timer()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                timer.record(timeit.default_timer() - start)
+
+        setattr(owner, name, timed)
+
+    # function to count the traci calls of a new connection
+    def count_calls(self, connection):
+        return CountingConnection(connection, self)
+
+    # function to print and keep the breakdown of the last episode
+    def report(self):
+        sections = {
+            name: timer.summary()
+            for name, timer in self.sections.items()
+            if timer.count
+        }
+        traci_calls = {
+            name: timer.summary()
+            for name, timer in sorted(self.traci_calls.items())
+            if timer.count
+        }
+        cached_reads = {
+            name: timer.summary()
+            for name, timer in sorted(self.cached_reads.items())
+            if timer.count
+        }
+        episode = {
+            "episode": len(self.episodes),
+            "sections": sections,
+            "traci": traci_calls,
+            "traci_calls": sum(summary["count"] for summary in traci_calls.values()),
+            "cached": cached_reads,
+            "cached_reads": sum(summary["count"] for summary in cached_reads.values()),
+        }
+        self.episodes.append(episode)
+
+        print("Profile of episode", episode["episode"] + 1)
+        print(
+            "  %-42s %9s %10s %12s %12s"
+            % ("section", "calls", "total s", "p50 s", "p99 s")
+        )
+        for name, summary in (
+            list(sections.items())
+            + [("traci." + name, summary) for name, summary in traci_calls.items()]
+            + [("cached." + name, summary) for name, summary in cached_reads.items()]
+        ):
+            print(
+                "  %-42s %9d %10.3f %12.2e %12.2e"
+                % (
+                    name,
+                    summary["count"],
+                    summary["total"],
+                    summary["p50"],
+                    summary["p99"],
+                )
+            )
+        print("  traci calls:", episode["traci_calls"])
+        print("  cached reads:", episode["cached_reads"])
+
+        # the wrappers keep their timers, so they are reset in place
+        for timers in [self.sections, self.traci_calls, self.cached_reads]:
+            for timer in timers.values():
+                timer.reset()
+
+    # function to write the breakdown of all episodes as json
+    def export(self, file_path):
+        with open(file_path, "w") as profile_file:
+            json.dump({"episodes": self.episodes}, profile_file, indent=1)
+
+
+# passes every call to the connection and its domains through a timer, the reads of
+# the subscription results go to the cached reads instead of the traci calls
+class CountingConnection:
+    def __init__(self, connection, profiler, prefix=""):
+        self._connection = connection
+        self._profiler = profiler
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        attribute = getattr(self._connection, name)
+
+        if callable(attribute):
+            timers = self._profiler.traci_calls
+            if name in CACHED_READS:
+                timers = self._profiler.cached_reads
+            timer = self._profiler.timer(timers, self._prefix + name)
+
+            def counted(*args, **kwargs):
+                start = timeit.default_timer()
+                try:
+                    return attribute(*args, **kwargs)
+                finally:
+                    timer.record(timeit.default_timer() - start)
+
+            wrapped = counted
+        elif hasattr(attribute, "__dict__"):
+            # a domain such as edge or vehicle
+            wrapped = CountingConnection(attribute, self._profiler, name + ".")
+        else:
+            return attribute
+
+        # later lookups of the same attribute skip __getattr__
+        setattr(self, name, wrapped)
+        return wrapped
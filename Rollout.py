@@ -0,0 +1,349 @@
+"""
+Parallel episode rollouts on several sumo instances
+"""
+import multiprocessing
+import os
+import queue
+import timeit
+
+from Policy import PolicyRuntime
+from Simulation import Simulation
+from Traffic import TrafficGenerator
+
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# simulation of a worker process, created once by the pool initializer
+worker_simulation = None
+
+# seconds the learner waits for a message before it checks that the actors are alive
+RECEIVE_TIMEOUT = 1
+
+
+# collects the samples of one episode inside a worker process
+class EpisodeBuffer:
+    def __init__(self):
+        self.sample_list = []
+
+    def add_sample(self, sample):
+        self.sample_list.append(sample)
+
+
+# function to create the simulation of a worker or actor process
+def create_simulation(config, sumo_cmd, label, Model, Memory):
+    """
+    Every process runs its own sumo instance with its own label and route file
+    """
+    route_file = os.path.join("environment", "episode_routes_%s.rou.xml" % label)
+
+    return Simulation(
+        Model,
+        Memory,
+        TrafficGenerator(
+            config["max_steps"],
+            config["n_cars_generated"],
+            route_file,
+            config["route_mode"],
+        ),
+        sumo_cmd,
+        config["gamma"],
+        config["max_steps"],
+        config["green_duration"],
+        config["yellow_duration"],
+        config["num_states"],
+        config["num_actions"],
+        config["epochs"],
+        label,
+        config["queue_edges"],
+        config["step_mode"],
+    )
+
+
+# function to set up the simulation of a worker process
+def init_worker(config, sumo_cmd):
+    global worker_simulation
+
+    worker_simulation = create_simulation(
+        config,
+        sumo_cmd,
+        "worker_%d" % os.getpid(),
+        PolicyRuntime(config["num_states"]),
+        EpisodeBuffer(),
+    )
+
+
+# function to run one episode in a worker process
+def run_worker_episode(task):
+    episode, epsilon, weights = task
+
+    worker_simulation.Model.set_weights(weights)
+    worker_simulation.Memory = EpisodeBuffer()
+    simulation_time = worker_simulation.run_episode(episode, epsilon)
+
+    return (
+        worker_simulation.Memory.sample_list,
+        worker_simulation.get_episode_stats(),
+        simulation_time,
+    )
+
+
+# pool of worker processes that run episodes at the same time
+class RolloutPool:
+    def __init__(self, workers, config, sumo_cmd):
+        self.workers = workers
+
+        # spawned workers do not inherit the keras state of the training process
+        context = multiprocessing.get_context("spawn")
+        self.pool = context.Pool(
+            workers, initializer=init_worker, initargs=(config, sumo_cmd)
+        )
+
+    def run(self, simulation, first_episode, epsilons):
+        """
+        Run one episode per epsilon in parallel with the current weights, add their
+        samples to the shared memory and then train the agent on them
+        """
+        start_time = timeit.default_timer()
+
+        weights = simulation.Model.get_weights()
+        tasks = [
+            (first_episode + n, epsilon, weights) for n, epsilon in enumerate(epsilons)
+        ]
+
+        # results come back in episode order
+        for sample_list, episode_stats, _ in self.pool.imap(run_worker_episode, tasks):
+            for sample in sample_list:
+                simulation.Memory.add_sample(sample)
+            simulation.add_episode_stats(*episode_stats)
+
+        simulation_time = round(timeit.default_timer() - start_time, 1)
+        training_time = simulation.train(simulation.epochs * len(epsilons))
+
+        return simulation_time, training_time
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+# sends the samples of an actor to the learner as soon as they are taken
+class QueueBuffer:
+    def __init__(self, sample_queue):
+        self.sample_queue = sample_queue
+
+    def add_sample(self, sample):
+        self.sample_queue.put(("sample", sample))
+
+
+# policy of an actor, picks up the weights published by the learner
+class ActorPolicy(PolicyRuntime):
+    def __init__(self, input_dim, weights_queue):
+        super().__init__(input_dim)
+        self.weights_queue = weights_queue
+
+    def refresh(self):
+        """
+        Switch to the newest published weights, waits for the first ones
+        """
+        if self.forward is None:
+            self.set_weights(self.weights_queue.get())
+
+        weights = None
+        while True:
+            try:
+                weights = self.weights_queue.get_nowait()
+            except queue.Empty:
+                break
+
+        if weights is not None:
+            self.set_weights(weights)
+
+    def predict_single(self, state):
+        self.refresh()
+        return super().predict_single(state)
+
+
+# function run by every actor process
+def run_actor(
+    actor_index,
+    n_actors,
+    first_episode,
+    epsilons,
+    config,
+    sumo_cmd,
+    sample_queue,
+    weights_queue,
+):
+    """
+    Actor i plays the episodes i, i + n_actors, ... after first_episode and streams
+    their samples, the episode number is the seed of its routes
+    """
+    simulation = create_simulation(
+        config,
+        sumo_cmd,
+        "actor_%d" % actor_index,
+        ActorPolicy(config["num_states"], weights_queue),
+        QueueBuffer(sample_queue),
+    )
+
+    for episode in range(actor_index, len(epsilons), n_actors):
+        simulation_time = simulation.run_episode(
+            first_episode + episode, epsilons[episode]
+        )
+        sample_queue.put(
+            ("episode", episode, simulation.get_episode_stats(), simulation_time)
+        )
+
+    sample_queue.put(("done", actor_index))
+
+
+# actors step sumo while the learner trains on their samples at the same time
+class ActorLearner:
+    def __init__(self, actors, config, sumo_cmd, publish_interval=100):
+        self.actors = actors
+        self.config = config
+        self.sumo_cmd = sumo_cmd
+        self.publish_interval = publish_interval
+
+    def run(self, simulation, first_episode, epsilons):
+        """
+        Run one episode per epsilon from first_episode on the actors and train
+        continuously, the number of replay updates is the same as in the
+        sequential loop
+        """
+        start_time = timeit.default_timer()
+        context = multiprocessing.get_context("spawn")
+
+        sample_queue = context.Queue()
+        weights_queues = [context.Queue(maxsize=1) for n in range(self.actors)]
+        processes = [
+            context.Process(
+                target=run_actor,
+                args=(
+                    n,
+                    self.actors,
+                    first_episode,
+                    epsilons,
+                    self.config,
+                    self.sumo_cmd,
+                    sample_queue,
+                    weights_queues[n],
+                ),
+            )
+            for n in range(self.actors)
+        ]
+        for process in processes:
+            process.start()
+
+        self.publish(simulation, weights_queues)
+
+        total_updates = len(epsilons) * simulation.epochs
+        updates = 0
+        finished_episodes = 0
+        done_actors = set()
+        episode_stats = {}
+        simulation_time = 0
+        training_time = 0
+
+        while updates < total_updates or len(done_actors) < self.actors:
+            # the learner stays at most one episode worth of updates ahead
+            allowed_updates = min(
+                (finished_episodes + 1) * simulation.epochs, total_updates
+            )
+            memory_ready = simulation.Memory.current_size() > simulation.Memory.min_size
+            can_train = memory_ready and updates < allowed_updates
+
+            if len(done_actors) == self.actors and not can_train:
+                break
+
+            # wait for samples only when there is nothing to train on, an actor
+            # that died without finishing its episodes stops the run
+            self.check_actors(processes, weights_queues, done_actors)
+            for message in self.receive(
+                sample_queue,
+                not can_train,
+                lambda: self.check_actors(processes, weights_queues, done_actors),
+            ):
+                if message[0] == "sample":
+                    simulation.Memory.add_sample(message[1])
+                elif message[0] == "episode":
+                    episode_stats[message[1]] = message[2]
+                    simulation_time += message[3]
+                    finished_episodes += 1
+                else:
+                    done_actors.add(message[1])
+
+            if can_train:
+                train_start_time = timeit.default_timer()
+                simulation.replay()
+                training_time += timeit.default_timer() - train_start_time
+                updates += 1
+
+                if updates % self.publish_interval == 0:
+                    self.publish(simulation, weights_queues)
+
+        for process in processes:
+            process.join()
+
+        self.close(weights_queues)
+
+        for episode in sorted(episode_stats):
+            simulation.add_episode_stats(*episode_stats[episode])
+
+        wall_time = round(timeit.default_timer() - start_time, 1)
+        return wall_time, round(simulation_time, 1), round(training_time, 1)
+
+    # function to drop the weights the actors did not pick up before finishing
+    def close(self, weights_queues):
+        for weights_queue in weights_queues:
+            weights_queue.cancel_join_thread()
+            weights_queue.close()
+
+    # function to stop the run when an actor exited before finishing its episodes
+    def check_actors(self, processes, weights_queues, done_actors):
+        for actor_index, process in enumerate(processes):
+            if actor_index in done_actors or process.exitcode in (None, 0):
+                continue
+
+            for other_process in processes:
+                other_process.terminate()
+            self.close(weights_queues)
+            raise RuntimeError(
+                "Actor %d exited with code %d before finishing its episodes"
+                % (actor_index, process.exitcode)
+            )
+
+    def publish(self, simulation, weights_queues):
+
+        # weights an actor has not picked up yet are replaced by the new ones
+        weights = simulation.Model.get_weights()
+        for weights_queue in weights_queues:
+            try:
+                weights_queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                weights_queue.put_nowait(weights)
+            except queue.Full:
+                pass
+
+    def receive(self, sample_queue, block, check_actors):
+        """
+        Return all queued messages, waits for the first one if block is set and
+        calls check_actors every RECEIVE_TIMEOUT seconds while it waits
+        """
+        messages = []
+        while block and not messages:
+            try:
+                messages.append(sample_queue.get(timeout=RECEIVE_TIMEOUT))
+            except queue.Empty:
+                check_actors()
+
+        while True:
+            try:
+                messages.append(sample_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return messages
@@ -0,0 +1,622 @@
+"""
+Vectorized queueing simulator of the intersection that stands in for sumo
+"""
+import os
+import xml.etree.ElementTree as ET
+import numpy as np
+import traci.constants as tc
+
+from Observation import INCOMING_LANES, LANE_INDEX, LANE_LENGTH
+
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# speed below which a car counts as halting, same as in sumo
+HALTING_SPEED = 0.1
+
+# speed limit of the lanes in environment.net.xml
+LANE_SPEED = 13.89
+
+# sumo default seed, used for the random departure lanes
+DEFAULT_SEED = 23423
+
+# seconds before a car reaches the stop line in which the cars of the links that
+# yield to it wait
+YIELD_TIME = 3
+
+# vehicle states
+PENDING = 0
+INCOMING = 1
+OUTGOING = 2
+ARRIVED = 3
+
+# per vehicle arrays of the simulator
+VEHICLE_ARRAYS = [
+    ("state", np.int8),
+    ("depart", np.float64),
+    ("depart_speed", np.float64),
+    ("lane", np.int64),
+    ("link", np.int64),
+    ("out_edge", np.int64),
+    ("pos", np.float64),
+    ("speed", np.float64),
+    ("wait", np.float64),
+]
+
+
+# function to start the surrogate from a sumo command line
+def start_surrogate(sumo_cmd):
+    """
+    Reads -c, --route-files, --additional-files and --seed, the other sumo
+    options are ignored
+    """
+    options = {}
+    for name, value in zip(sumo_cmd[1::2], sumo_cmd[2::2]):
+        options[name] = value
+
+    config_file = options["-c"]
+    config_dir = os.path.dirname(config_file)
+    config = ET.parse(config_file).getroot()
+
+    net_file = os.path.join(config_dir, config.find("input/net-file").get("value"))
+
+    # route files on the command line replace the ones in the config file
+    if "--route-files" in options:
+        route_file = options["--route-files"]
+    else:
+        route_file = os.path.join(
+            config_dir, config.find("input/route-files").get("value")
+        )
+
+    connection = SurrogateConnection(net_file, int(options.get("--seed", DEFAULT_SEED)))
+    if route_file:
+        connection.load_routes(route_file)
+    if options.get("--additional-files"):
+        connection.load_additional(options["--additional-files"])
+
+    return connection
+
+
+class SurrogateConnection:
+    def __init__(self, net_file, seed=DEFAULT_SEED):
+        self.rng = np.random.default_rng(seed)
+        self.dawdle_rng = np.random.default_rng(seed + 1)
+        self.time = 0
+        self.phase = 0
+
+        # same defaults as the sumo passenger car
+        self.vehicle_type = {
+            "accel": 2.6,
+            "decel": 4.5,
+            "length": 5.0,
+            "minGap": 2.5,
+            "maxSpeed": 55.56,
+            "sigma": 0.5,
+        }
+        self.routes = {}
+
+        # edge data outputs, written when the connection is closed
+        self.edge_data = []
+
+        self.load_network(net_file)
+
+        # vehicle arrays, grown when vehicles are added, id_index maps a vehicle id
+        # to its row
+        self.ids = []
+        self.id_index = {}
+        self.capacity = 0
+        self.size = 0
+        self.allocate(1024)
+
+        self.vehicle = VehicleDomain(self)
+        self.edge = EdgeDomain(self)
+        self.trafficlight = TrafficLightDomain(self)
+        self.route = RouteDomain(self)
+        self.vehicletype = VehicleTypeDomain(self)
+        self.simulation = SimulationDomain(self)
+
+    # function to read lanes, connections and phases from the net file
+    def load_network(self, net_file):
+        net = ET.parse(net_file).getroot()
+
+        # outgoing edges are the non internal edges that are not incoming
+        self.out_edges = []
+        for edge in net.iter("edge"):
+            if edge.get("function") != "internal" and not any(
+                lane.get("id") in LANE_INDEX for lane in edge.iter("lane")
+            ):
+                self.out_edges.append(edge.get("id"))
+        self.out_edge_index = {edge_id: n for n, edge_id in enumerate(self.out_edges)}
+
+        # link index of every lane -> outgoing edge connection of the traffic light
+        self.link_index = {}
+        self.allowed_lanes = {}
+        for connection in net.iter("connection"):
+            lane_id = "%s_%s" % (connection.get("from"), connection.get("fromLane"))
+            if connection.get("tl") is None or lane_id not in LANE_INDEX:
+                continue
+
+            lane = LANE_INDEX[lane_id]
+            key = (connection.get("from"), connection.get("to"))
+            self.link_index[(lane, connection.get("to"))] = int(
+                connection.get("linkIndex")
+            )
+            self.allowed_lanes.setdefault(key, []).append(lane)
+
+        # a car may pass when its link shows G or g in the current phase, on g
+        # it yields to the cars of the foe links and on y it only passes when it
+        # can not stop anymore
+        tl_logic = net.find("tlLogic")
+        self.tl_id = tl_logic.get("id")
+        states = [phase.get("state") for phase in tl_logic.iter("phase")]
+        self.phase_green = np.array([[signal in "Gg" for signal in s] for s in states])
+        self.phase_minor = np.array([[signal == "g" for signal in s] for s in states])
+        self.phase_yellow = np.array([[signal == "y" for signal in s] for s in states])
+
+        # links each link has to yield to, the response bits are in reverse order
+        junction = net.find("junction[@id='%s']" % self.tl_id)
+        self.link_response = np.zeros((len(states[0]), len(states[0])), dtype=bool)
+        for request in junction.iter("request"):
+            response = request.get("response")[::-1]
+            self.link_response[int(request.get("index"))] = [
+                bit == "1" for bit in response
+            ]
+
+    # function to read the vehicle type, routes and vehicles of a route file
+    def load_routes(self, route_file):
+        routes = ET.parse(route_file).getroot()
+
+        for vehicle_type in routes.iter("vType"):
+            for name in self.vehicle_type:
+                if vehicle_type.get(name) is not None:
+                    self.vehicle_type[name] = float(vehicle_type.get(name))
+
+        for route in routes.iter("route"):
+            self.routes[route.get("id")] = route.get("edges").split()
+
+        for vehicle in routes.iter("vehicle"):
+            self.add_vehicle(
+                vehicle.get("id"),
+                vehicle.get("route"),
+                float(vehicle.get("depart")),
+                float(vehicle.get("departSpeed", 0)),
+            )
+
+    def allocate(self, capacity):
+        """
+        Grow the vehicle arrays, the values of the added vehicles are kept
+        """
+        for name, dtype in VEHICLE_ARRAYS:
+            array = np.zeros(capacity, dtype=dtype)
+            if self.capacity > 0:
+                array[: self.size] = getattr(self, name)[: self.size]
+            setattr(self, name, array)
+
+        self.capacity = capacity
+
+    def add_vehicle(self, vehicle_id, route_id, depart, depart_speed):
+        if self.size == self.capacity:
+            self.allocate(self.capacity * 2)
+
+        from_edge, to_edge = self.routes[route_id][0], self.routes[route_id][-1]
+
+        # departLane="random" picks one of the lanes that lead to the route's exit
+        lane = self.rng.choice(self.allowed_lanes[(from_edge, to_edge)])
+
+        n = self.size
+        self.ids.append(vehicle_id)
+        self.id_index[vehicle_id] = n
+        self.state[n] = PENDING
+        self.depart[n] = depart
+        self.depart_speed[n] = depart_speed
+        self.lane[n] = lane
+        self.link[n] = self.link_index[(lane, to_edge)]
+        self.out_edge[n] = self.out_edge_index[to_edge]
+        self.size += 1
+
+    # function to read the edge data outputs of an additional file
+    def load_additional(self, additional_file):
+        """
+        Only the waiting time on the incoming edges is supported, the output file
+        is relative to the additional file like in sumo
+        """
+        additional_dir = os.path.dirname(additional_file)
+        for edge_data in ET.parse(additional_file).getroot().iter("edgeData"):
+            edges = edge_data.get("edges").split()
+
+            # incoming lanes of each edge, the halting counts of the lanes are
+            # summed into the edges with one product per step
+            lanes = np.zeros((len(edges), len(INCOMING_LANES)), dtype=np.int64)
+            for row, edge_id in enumerate(edges):
+                for lane_id in (edge_id + "_0", edge_id + "_1"):
+                    if lane_id in LANE_INDEX:
+                        lanes[row, LANE_INDEX[lane_id]] = 1
+
+            self.edge_data.append(
+                {
+                    "id": edge_data.get("id"),
+                    "file": os.path.join(additional_dir, edge_data.get("file")),
+                    "period": int(float(edge_data.get("period", 1))),
+                    "edges": edges,
+                    "lanes": lanes,
+                    "waiting_times": [],
+                }
+            )
+
+    def simulationStep(self, step=0):
+        """
+        Advance one second, or up to the given time like sumo
+        """
+        self.step()
+        while self.time < step:
+            self.step()
+
+    def step(self):
+        self.time += 1
+        n = self.size
+        state = self.state[:n]
+
+        self.insert_departed(state)
+        self.move_incoming(state)
+        self.move_outgoing(state)
+
+        # accumulated waiting time of the halting cars
+        active = (state == INCOMING) | (state == OUTGOING)
+        halting = active & (self.speed[:n] < HALTING_SPEED)
+        self.wait[:n][halting] += 1
+
+        if self.edge_data:
+            incoming = halting & (state == INCOMING)
+            lane_halting = np.bincount(
+                self.lane[:n][incoming], minlength=len(INCOMING_LANES)
+            )
+            for edge_data in self.edge_data:
+                edge_data["waiting_times"].append(edge_data["lanes"] @ lane_halting)
+
+    # function to put departed cars on their lane if there is space
+    def insert_departed(self, state):
+        ready = np.flatnonzero(
+            (state == PENDING) & (self.depart[: self.size] <= self.time)
+        )
+        if len(ready) == 0:
+            return
+
+        spacing = self.vehicle_type["length"] + self.vehicle_type["minGap"]
+        start_pos = self.vehicle_type["length"]
+
+        # position of the last car on each lane
+        on_lane = np.flatnonzero(state == INCOMING)
+        lane_tail = np.full(len(LANE_INDEX), np.inf)
+        np.minimum.at(lane_tail, self.lane[on_lane], self.pos[on_lane])
+
+        for n in ready:
+            lane = self.lane[n]
+            if lane_tail[lane] - spacing >= start_pos:
+                state[n] = INCOMING
+                self.pos[n] = start_pos
+                self.speed[n] = min(
+                    self.depart_speed[n], lane_tail[lane] - spacing - start_pos
+                )
+                lane_tail[lane] = start_pos
+
+    # function to move the cars on the incoming lanes
+    def move_incoming(self, state):
+        """
+        Krauss style car following for all lanes at once: cars accelerate up to the
+        speed limit, brake for the stop line when they may not cross, keep
+        length + minGap to where the car in front was and slow down at random
+        """
+        incoming = np.flatnonzero(state == INCOMING)
+        if len(incoming) == 0:
+            return
+
+        # leaders first: by lane and then by position from the traffic light
+        order = incoming[np.lexsort((-self.pos[incoming], self.lane[incoming]))]
+        lane = self.lane[order]
+        pos = self.pos[order]
+        speed = self.speed[order]
+
+        max_speed = min(self.vehicle_type["maxSpeed"], LANE_SPEED)
+        accel = self.vehicle_type["accel"]
+        new_pos = pos + np.minimum(speed + accel, max_speed)
+
+        # cars that may not cross brake with decel to stop at the line, at the
+        # safe speed of the krauss model in front of a standing obstacle
+        decel = self.vehicle_type["decel"]
+        stop_speed = np.sqrt(decel**2 + 2 * decel * (LANE_LENGTH - pos)) - decel
+        new_pos = np.where(
+            self.may_pass(self.link[order], pos, speed),
+            new_pos,
+            np.minimum(new_pos, pos + np.maximum(stop_speed, 0)),
+        )
+
+        # a car can be at most where its leader was before the step minus the
+        # spacing, so that a queue starts moving one car after the other
+        spacing = self.vehicle_type["length"] + self.vehicle_type["minGap"]
+        leader_pos = np.r_[np.inf, pos[:-1]]
+        leader_pos[np.r_[True, lane[1:] != lane[:-1]]] = np.inf
+        new_pos = np.minimum(new_pos, leader_pos - spacing)
+        new_speed = np.maximum(new_pos - pos, 0)
+
+        # random slow down of the krauss model, a starting car loses at most
+        # a part of its own speed
+        new_speed -= (
+            self.vehicle_type["sigma"]
+            * np.minimum(new_speed, accel)
+            * self.dawdle_rng.random(len(order))
+        )
+        new_pos = pos + new_speed
+
+        self.speed[order] = new_speed
+        self.pos[order] = new_pos
+
+        # cars past the stop line continue on their outgoing edge
+        crossed = order[new_pos > LANE_LENGTH]
+        state[crossed] = OUTGOING
+        self.pos[crossed] -= LANE_LENGTH
+
+    # function to check which cars may cross the stop line in this step
+    def may_pass(self, link, pos, speed):
+        """
+        A car passes on green, on a permissive green when no car of a foe link is
+        about to cross and on yellow when it is too close to stop
+        """
+        green = self.phase_green[self.phase]
+        distance = LANE_LENGTH - pos
+
+        # links with a car that reaches the stop line within YIELD_TIME
+        arriving = (speed > HALTING_SPEED) & (distance < speed * YIELD_TIME)
+        busy = np.zeros(len(green), dtype=bool)
+        busy[link[arriving]] = True
+        blocked = self.phase_minor[self.phase] & (
+            self.link_response & (busy & green)
+        ).any(axis=1)
+
+        stopping_distance = speed**2 / (2 * self.vehicle_type["decel"])
+        late = self.phase_yellow[self.phase][link] & (stopping_distance > distance)
+
+        return (green & ~blocked)[link] | late
+
+    # function to move the cars on the outgoing edges
+    def move_outgoing(self, state):
+        outgoing = np.flatnonzero(state == OUTGOING)
+        if len(outgoing) == 0:
+            return
+
+        max_speed = min(self.vehicle_type["maxSpeed"], LANE_SPEED)
+        self.speed[outgoing] = np.minimum(
+            self.speed[outgoing] + self.vehicle_type["accel"], max_speed
+        )
+        self.pos[outgoing] += self.speed[outgoing]
+
+        arrived = outgoing[self.pos[outgoing] > LANE_LENGTH]
+        state[arrived] = ARRIVED
+        self.speed[arrived] = 0
+
+    # function to get the cars on an edge
+    def vehicles_on_edge(self, edge_id):
+        n = self.size
+        if edge_id in self.out_edge_index:
+            return np.flatnonzero(
+                (self.state[:n] == OUTGOING)
+                & (self.out_edge[:n] == self.out_edge_index[edge_id])
+            )
+
+        lanes = [LANE_INDEX[edge_id + "_0"], LANE_INDEX[edge_id + "_1"]]
+        return np.flatnonzero(
+            (self.state[:n] == INCOMING) & np.isin(self.lane[:n], lanes)
+        )
+
+    def lane_id(self, n):
+        if self.state[n] == INCOMING:
+            return INCOMING_LANES[self.lane[n]]
+        return self.out_edges[self.out_edge[n]] + "_0"
+
+    def road_id(self, n):
+        return self.lane_id(n).rsplit("_", 1)[0]
+
+    # function to get a subscribed variable of a car
+    def variable(self, n, variable_id):
+        if variable_id == tc.VAR_LANE_ID:
+            return self.lane_id(n)
+        elif variable_id == tc.VAR_ROAD_ID:
+            return self.road_id(n)
+        elif variable_id == tc.VAR_LANEPOSITION:
+            return float(self.pos[n])
+        elif variable_id == tc.VAR_SPEED:
+            return float(self.speed[n])
+        elif variable_id == tc.VAR_ACCUMULATED_WAITING_TIME:
+            return float(self.wait[n])
+        raise ValueError("Variable %d is not supported by the surrogate" % variable_id)
+
+    def close(self):
+        for edge_data in self.edge_data:
+            self.write_edge_data(edge_data)
+
+    # function to write an edge data output like sumo
+    def write_edge_data(self, edge_data):
+        """
+        Each halting car adds one second to the waiting time of its edge in
+        the interval of the step
+        """
+        period = edge_data["period"]
+        waiting_times = np.array(edge_data["waiting_times"], dtype=np.float64)
+        waiting_times = waiting_times.reshape(-1, len(edge_data["edges"]))
+
+        lines = ["<meandata>"]
+        for begin in range(0, len(waiting_times), period):
+            lines.append(
+                '    <interval begin="%.2f" end="%.2f" id="%s">'
+                % (begin, begin + period, edge_data["id"])
+            )
+            interval = waiting_times[begin : begin + period].sum(axis=0)
+            for edge_id, waiting_time in zip(edge_data["edges"], interval):
+                lines.append(
+                    '        <edge id="%s" waitingTime="%.2f"/>'
+                    % (edge_id, waiting_time)
+                )
+            lines.append("    </interval>")
+        lines.append("</meandata>")
+
+        with open(edge_data["file"], "w") as output:
+            output.write("\n".join(lines) + "\n")
+
+
+class VehicleDomain:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def getIDList(self):
+        connection = self.connection
+        state = connection.state[: connection.size]
+        active = np.flatnonzero((state == INCOMING) | (state == OUTGOING))
+        return tuple(connection.ids[n] for n in active)
+
+    def getLanePosition(self, vehicle_id):
+        return self.get(vehicle_id, tc.VAR_LANEPOSITION)
+
+    def getLaneID(self, vehicle_id):
+        return self.get(vehicle_id, tc.VAR_LANE_ID)
+
+    def getRoadID(self, vehicle_id):
+        return self.get(vehicle_id, tc.VAR_ROAD_ID)
+
+    def getSpeed(self, vehicle_id):
+        return self.get(vehicle_id, tc.VAR_SPEED)
+
+    def getAccumulatedWaitingTime(self, vehicle_id):
+        return self.get(vehicle_id, tc.VAR_ACCUMULATED_WAITING_TIME)
+
+    def get(self, vehicle_id, variable_id):
+        connection = self.connection
+        return connection.variable(connection.id_index[vehicle_id], variable_id)
+
+    def add(
+        self,
+        vehID,
+        routeID,
+        typeID="DEFAULT_VEHTYPE",
+        depart="now",
+        departLane="first",
+        departPos="base",
+        departSpeed="0",
+        **kwargs
+    ):
+        connection = self.connection
+        depart_time = connection.time if depart == "now" else float(depart)
+        connection.add_vehicle(vehID, routeID, depart_time, float(departSpeed))
+
+
+class EdgeDomain:
+    def __init__(self, connection):
+        self.connection = connection
+        self.context_subscriptions = {}
+        self.subscriptions = {}
+
+    def getLastStepHaltingNumber(self, edge_id):
+        connection = self.connection
+        on_edge = connection.vehicles_on_edge(edge_id)
+        return int(np.count_nonzero(connection.speed[on_edge] < HALTING_SPEED))
+
+    def getLastStepVehicleNumber(self, edge_id):
+        return len(self.connection.vehicles_on_edge(edge_id))
+
+    def subscribe(self, objectID, varIDs=None, **kwargs):
+        self.subscriptions[objectID] = list(varIDs)
+
+    def getSubscriptionResults(self, objectID):
+        """
+        Values of the subscribed variables of the edge
+        """
+        results = {}
+        for variable_id in self.subscriptions.get(objectID, []):
+            if variable_id == tc.LAST_STEP_VEHICLE_HALTING_NUMBER:
+                results[variable_id] = self.getLastStepHaltingNumber(objectID)
+            elif variable_id == tc.LAST_STEP_VEHICLE_NUMBER:
+                results[variable_id] = self.getLastStepVehicleNumber(objectID)
+            else:
+                raise ValueError(
+                    "Variable %d is not supported by the surrogate" % variable_id
+                )
+        return results
+
+    def subscribeContext(self, objectID, domain, dist, varIDs=None, **kwargs):
+        if domain != tc.CMD_GET_VEHICLE_VARIABLE:
+            raise ValueError(
+                "The surrogate only supports vehicle context subscriptions"
+            )
+        self.context_subscriptions[objectID] = list(varIDs)
+
+    def getContextSubscriptionResults(self, objectID):
+        """
+        Values of the subscribed variables for the cars on the edge
+        """
+        connection = self.connection
+        variable_ids = self.context_subscriptions.get(objectID, [])
+
+        results = {}
+        for n in connection.vehicles_on_edge(objectID):
+            results[connection.ids[n]] = {
+                variable_id: connection.variable(n, variable_id)
+                for variable_id in variable_ids
+            }
+        return results
+
+
+class TrafficLightDomain:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def setPhase(self, tlsID, index):
+        self.connection.phase = index
+
+    def getPhase(self, tlsID):
+        return self.connection.phase
+
+
+class RouteDomain:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def add(self, routeID, edges):
+        self.connection.routes[routeID] = list(edges)
+
+
+class VehicleTypeDomain:
+    def __init__(self, connection):
+        self.connection = connection
+
+    # there is a single vehicle type, copies and settings all apply to it
+    def copy(self, origTypeID, newTypeID):
+        pass
+
+    def setAccel(self, typeID, accel):
+        self.connection.vehicle_type["accel"] = accel
+
+    def setDecel(self, typeID, decel):
+        self.connection.vehicle_type["decel"] = decel
+
+    def setLength(self, typeID, length):
+        self.connection.vehicle_type["length"] = length
+
+    def setMinGap(self, typeID, minGap):
+        self.connection.vehicle_type["minGap"] = minGap
+
+    def setMaxSpeed(self, typeID, speed):
+        self.connection.vehicle_type["maxSpeed"] = speed
+
+    def setImperfection(self, typeID, imperfection):
+        self.connection.vehicle_type["sigma"] = imperfection
+
+
+class SimulationDomain:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def getTime(self):
+        return float(self.connection.time)
+
+    def getMinExpectedNumber(self):
+        connection = self.connection
+        return int(np.count_nonzero(connection.state[: connection.size] != ARRIVED))
@@ -0,0 +1,166 @@
+"""
+Streaming telemetry of a simulation written in chunks of columns
+"""
+import glob
+import os
+import numpy as np
+
+import warnings
+
+warnings.filterwarnings("ignore")
+
+# rows kept in memory before a chunk is written
+CHUNK_SIZE = 4096
+
+
+# one table of telemetry, the rows are collected in a preallocated chunk that
+# is written to its own .npy file when it is full
+class TelemetryStream:
+    def __init__(self, path, name, columns, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.name = name
+        self.buffer = np.zeros(chunk_size, dtype=columns)
+        self.length = 0
+        self.chunks = 0
+
+    # function to remove the chunks of a previous run
+    def reset(self):
+        os.makedirs(self.path, exist_ok=True)
+        for chunk_file in self.chunk_files():
+            os.remove(chunk_file)
+
+        self.length = 0
+        self.chunks = 0
+
+    def append(self, *values):
+        self.buffer[self.length] = values
+        self.length += 1
+
+        if self.length == len(self.buffer):
+            self.flush()
+
+    def extend(self, **columns):
+        """
+        Append many rows at once, every column is an array of the same length
+        """
+        rows = len(next(iter(columns.values())))
+        start = 0
+
+        while start < rows:
+            count = min(rows - start, len(self.buffer) - self.length)
+            chunk = self.buffer[self.length : self.length + count]
+            for column, values in columns.items():
+                chunk[column] = values[start : start + count]
+
+            self.length += count
+            start += count
+            if self.length == len(self.buffer):
+                self.flush()
+
+    # function to write the collected rows as the next chunk
+    def flush(self):
+        if self.length == 0:
+            return
+
+        np.save(
+            os.path.join(self.path, "%s_%05d.npy" % (self.name, self.chunks)),
+            self.buffer[: self.length],
+        )
+        self.chunks += 1
+        self.length = 0
+
+    # function to read one column of a single chunk, the rows not written yet are
+    # the last chunk
+    def read_chunk(self, index, column):
+        if index == self.chunks:
+            return self.buffer[column][: self.length]
+
+        chunk_file = os.path.join(self.path, "%s_%05d.npy" % (self.name, index))
+        return np.load(chunk_file)[column]
+
+    def chunk_files(self):
+        return sorted(glob.glob(os.path.join(self.path, self.name + "_*.npy")))
+
+    def read(self, column):
+        """
+        Return one column of all the written chunks and of the rows not written yet
+        """
+        values = [
+            np.load(chunk_file, mmap_mode="r")[column]
+            for chunk_file in self.chunk_files()
+        ]
+        values.append(self.buffer[column][: self.length])
+
+        return np.concatenate(values)
+
+
+# telemetry of a test or timed signal episode
+class Telemetry:
+    def __init__(self, path, queue_edges):
+        self.queue_columns = ["queue_" + edge_id for edge_id in queue_edges]
+
+        # one row per simulation step
+        self.steps = TelemetryStream(
+            path,
+            "steps",
+            [("step", np.int32), ("phase", np.int8), ("queue_length", np.int32)]
+            + [(column, np.int16) for column in self.queue_columns],
+        )
+
+        # one row per action of the agent or the timed signal
+        self.decisions = TelemetryStream(
+            path,
+            "decisions",
+            [
+                ("step", np.int32),
+                ("action", np.int8),
+                ("wait_time", np.float64),
+                ("reward", np.float64),
+                ("latency", np.float32),
+            ],
+        )
+
+        # signal phase of every step of a fast forward episode until its queues are
+        # read from the sumo output, removed when the episode is closed
+        self.phases = TelemetryStream(path, "phases", [("phase", np.int8)])
+
+    def reset(self):
+        self.steps.reset()
+        self.decisions.reset()
+        self.phases.reset()
+
+    # function to record the halting cars of one step
+    def add_step(self, step, phase, queue_length, edge_queues):
+        self.steps.append(step, phase, queue_length, *edge_queues)
+
+    # function to record the signal phase of the next steps
+    def add_phases(self, phase, steps):
+        self.phases.extend(phase=np.full(steps, phase, dtype=np.int8))
+
+    # function to record the halting cars of a chunk of steps with their phases
+    def add_steps(self, first_step, edge_queues):
+        """
+        edge_queues has one row per step and one column per traced edge, the chunk
+        starts at a multiple of CHUNK_SIZE like the chunks of the phases
+        """
+        rows = len(edge_queues)
+        phases = self.phases.read_chunk(first_step // CHUNK_SIZE, "phase")
+        columns = dict(zip(self.queue_columns, edge_queues.T))
+        self.steps.extend(
+            step=np.arange(first_step + 1, first_step + rows + 1),
+            phase=phases[:rows],
+            queue_length=edge_queues.sum(axis=1),
+            **columns
+        )
+
+    # function to record an action with its wait time, reward and decision time
+    def add_decision(self, step, action, wait_time, reward, latency):
+        self.decisions.append(step, action, wait_time, reward, latency)
+
+    def close(self):
+        self.steps.flush()
+        self.decisions.flush()
+        self.phases.reset()
+
+    def read(self, stream, column):
+        return getattr(self, stream).read(column)
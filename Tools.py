@@ -2,31 +2,41 @@
 Code for Tools used in this project
 """
 
-from sumolib import checkBinary
+import multiprocessing
 import os
 import sys
 import configparser
-import matplotlib.pyplot as plt
+import numpy as np
 
 import warnings
 
 warnings.filterwarnings("ignore")
 
+# binary name in the simulation command that selects the surrogate
+SURROGATE_BINARY = "surrogate"
+
+
 # function to set the sumo tool
-def set_sumo(gui, sumocfg_file, max_steps):
+def set_sumo(gui, sumocfg_file, max_steps, backend="sumo"):
     """
-    Set SUMO parameters
+    Set SUMO parameters, the surrogate backend takes the same command line
     """
-    if "SUMO_HOME" in os.environ:
-        tools = os.path.join(os.environ["SUMO_HOME"], "tools")
-        sys.path.append(tools)
+    if backend == "surrogate":
+        # the surrogate runs in this process and does not need a sumo installation
+        sumoBinary = SURROGATE_BINARY
     else:
-        sys.exit("Please declare environment variable 'SUMO_HOME'")
+        if "SUMO_HOME" in os.environ:
+            tools = os.path.join(os.environ["SUMO_HOME"], "tools")
+            sys.path.append(tools)
+        else:
+            sys.exit("Please declare environment variable 'SUMO_HOME'")
 
-    if gui == 0:
-        sumoBinary = checkBinary("sumo")
-    else:
-        sumoBinary = checkBinary("sumo-gui")
+        from sumolib import checkBinary
+
+        if gui == 0:
+            sumoBinary = checkBinary("sumo")
+        else:
+            sumoBinary = checkBinary("sumo-gui")
 
     sumo_cmd = [
         sumoBinary,
@@ -41,6 +51,32 @@ def set_sumo(gui, sumocfg_file, max_steps):
     return sumo_cmd
 
 
+# functions applied to every new connection, the profiler adds its call counter here
+connection_hooks = []
+
+
+# function to start sumo and connect to it
+def start_sumo(sumo_cmd, label="default"):
+    """
+    Start a sumo instance under its own label, several instances can run at once
+    """
+    # traci and the surrogate are only loaded by the modes that run an episode
+    if sumo_cmd[0] == SURROGATE_BINARY:
+        from Surrogate import start_surrogate
+
+        connection = start_surrogate(sumo_cmd)
+    else:
+        import traci
+
+        traci.start(sumo_cmd, label=label)
+        connection = traci.getConnection(label)
+
+    for hook in connection_hooks:
+        connection = hook(connection)
+
+    return connection
+
+
 # function to read config file
 def set_config(config_file):
     config = configparser.ConfigParser()
@@ -56,13 +92,30 @@ def set_config(config_file):
     parameters["yellow_duration"] = int(config.get("simulation", "yellow_duration"))
     parameters["epochs"] = int(config.get("simulation", "epochs"))
     parameters["seed"] = int(config.get("simulation", "seed"))
+    parameters["route_mode"] = config.get("simulation", "route_mode")
+    parameters["backend"] = config.get("simulation", "backend")
+    parameters["queue_edges"] = [
+        edge_id.strip()
+        for edge_id in config.get("simulation", "queue_edges").split(",")
+        if edge_id.strip()
+    ]
+    parameters["step_mode"] = config.get("simulation", "step_mode")
+    parameters["checkpoint_interval"] = int(
+        config.get("simulation", "checkpoint_interval")
+    )
     parameters["memory_size_min"] = int(config.get("memory", "memory_size_min"))
     parameters["memory_size_max"] = int(config.get("memory", "memory_size_max"))
+    parameters["memory_type"] = config.get("memory", "memory_type")
+    parameters["memory_path"] = config.get("memory", "memory_path")
+    parameters["priority_alpha"] = float(config.get("memory", "priority_alpha"))
+    parameters["priority_beta"] = float(config.get("memory", "priority_beta"))
     parameters["num_states"] = int(config.get("agent", "num_states"))
     parameters["num_actions"] = int(config.get("agent", "num_actions"))
     parameters["gamma"] = float(config.get("agent", "gamma"))
     parameters["batch_size"] = int(config.get("agent", "batch_size"))
     parameters["learning_rate"] = float(config.get("agent", "learning_rate"))
+    parameters["inference"] = config.get("agent", "inference")
+    parameters["policy_runtime"] = config.get("agent", "policy_runtime")
     parameters["models_path_name"] = config.get("dir", "models_path_name")
     parameters["sumocfg_file_name"] = config.get("dir", "sumocfg_file_name")
     parameters["test_model_path"] = config.get("dir", "test_model_path")
@@ -71,13 +124,90 @@ def set_config(config_file):
     return parameters
 
 
-# function to save observation plots
-def save_plot(path, data, filename, xlabel, ylabel):
+# points drawn per series, longer series are aggregated into this many buckets
+PLOT_BUCKETS = 500
+
+
+# function to aggregate a long series into buckets before it is plotted
+def downsample(data, buckets=PLOT_BUCKETS):
+    """
+    Return the position, min, max and mean of every bucket, a series with fewer
+    points than buckets is returned as it is
+    """
+    data = np.asarray(data, dtype=np.float64)
+    positions = np.arange(len(data), dtype=np.float64)
+    if len(data) <= buckets:
+        return positions, data, data, data
+
+    starts = np.linspace(0, len(data), buckets + 1).astype(np.int64)
+    counts = np.diff(starts)
+    starts = starts[:-1]
+
+    return (
+        starts + (counts - 1) / 2,
+        np.minimum.reduceat(data, starts),
+        np.maximum.reduceat(data, starts),
+        np.add.reduceat(data, starts) / counts,
+    )
+
+
+# function to render several observation plots in one pass
+def render_plots(path, plots):
+    """
+    plots holds (position, low, high, mean, filename, xlabel, ylabel) tuples, one
+    figure is drawn on the non-interactive Agg canvas and cleared between plots
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure()
+    FigureCanvasAgg(figure)
+
+    for position, low, high, mean, filename, xlabel, ylabel in plots:
+        axes = figure.add_subplot()
+        if len(position) and (low != high).any():
+            axes.fill_between(position, low, high, alpha=0.3, linewidth=0)
+        axes.plot(position, mean)
+        axes.set_xlabel(xlabel)
+        axes.set_ylabel(ylabel)
+
+        figure.savefig(os.path.join(path, filename + ".png"))
+        figure.clear()
+
+
+# renders the plots of a run in a background process so that the run goes on,
+# matplotlib is only loaded in that process
+class PlotWriter:
+    def __init__(self):
+        self.pool = None
+        self.results = []
+
+    # function to queue the plots of a run
+    def save_plots(self, path, plots):
+        """
+        plots holds (data, filename, xlabel, ylabel) tuples, the series are
+        downsampled here so that only the buckets are sent to the process
+        """
+        if self.pool is None:
+            context = multiprocessing.get_context("spawn")
+            self.pool = context.Pool(1)
+
+        plots = [downsample(data) + tuple(labels) for data, *labels in plots]
+        self.results.append(self.pool.apply_async(render_plots, (path, plots)))
+
+    # function to wait for the queued plots
+    def close(self):
+        if self.pool is None:
+            return
+
+        for result in self.results:
+            result.get()
+        self.results = []
+
+        self.pool.close()
+        self.pool.join()
+        self.pool = None
 
-    plt.plot(data)
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
 
-    figure = plt.gcf()
-    figure.savefig(os.path.join(path, filename + ".png"))
-    plt.close("all")
+# plot writer shared by the modes of a run
+plot_writer = PlotWriter()
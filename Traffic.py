@@ -6,11 +6,55 @@ import warnings
 
 warnings.filterwarnings("ignore")
 
+# route file written for every episode
+ROUTE_FILE = "environment/episode_routes.rou.xml"
+
+# vehicle type used by every car
+VEHICLE_TYPE_ID = "standard_car"
+VEHICLE_TYPE = {
+    "accel": 1.0,
+    "decel": 4.5,
+    "length": 5.0,
+    "minGap": 2.5,
+    "maxSpeed": 25,
+    "sigma": 0.5,
+}
+
+# routes through the intersection
+ROUTES = {
+    "W_N": ["W2TL", "TL2N"],
+    "W_E": ["W2TL", "TL2E"],
+    "W_S": ["W2TL", "TL2S"],
+    "N_W": ["N2TL", "TL2W"],
+    "N_E": ["N2TL", "TL2E"],
+    "N_S": ["N2TL", "TL2S"],
+    "E_W": ["E2TL", "TL2W"],
+    "E_N": ["E2TL", "TL2N"],
+    "E_S": ["E2TL", "TL2S"],
+    "S_W": ["S2TL", "TL2W"],
+    "S_N": ["S2TL", "TL2N"],
+    "S_E": ["S2TL", "TL2E"],
+}
+
+# 75% of the cars go straight, the others turn
+STRAIGHT_ROUTES = np.array(["W_E", "N_S", "E_W", "S_N"])
+TURN_ROUTES = np.array(["W_N", "W_S", "E_N", "E_S", "N_W", "N_E", "S_W", "S_E"])
+STRAIGHT_SHARE = 0.75
+
 
 class TrafficGenerator:
-    def __init__(self, max_steps, n_cars_generated):
+    def __init__(
+        self, max_steps, n_cars_generated, route_file=ROUTE_FILE, route_mode="file"
+    ):
         self.n_cars_generated = n_cars_generated
         self.max_steps = max_steps
+        self.route_file = route_file
+
+        # file - routes are written to route_file and loaded by sumo,
+        # inject - vehicles are added through traci and no file is written
+        self.route_mode = route_mode
+        self.car_routes = None
+        self.car_gen_steps = None
 
     def create_route(self, seed):
         """
@@ -26,113 +70,87 @@ class TrafficGenerator:
         )
         timings = np.sort(timings)
 
-        car_gen_steps = []
+        car_gen_steps = (self.max_steps * np.abs(timings)) / (
+            np.max(timings) - np.min(timings)
+        )
+        self.car_gen_steps = np.rint(car_gen_steps)
+
+        # choosing between going straight and turning, then the route, for all cars at once
+        str_or_turn_choice = np.random.uniform(size=self.n_cars_generated)
+        straight_choice = np.random.randint(
+            0, len(STRAIGHT_ROUTES), self.n_cars_generated
+        )
+        turn_choice = np.random.randint(0, len(TURN_ROUTES), self.n_cars_generated)
+        self.car_routes = np.where(
+            str_or_turn_choice < STRAIGHT_SHARE,
+            STRAIGHT_ROUTES[straight_choice],
+            TURN_ROUTES[turn_choice],
+        )
+
+        if self.route_mode == "file":
+            self.write_route_file()
 
-        for value in timings:
-            car_gen_steps = np.append(
-                car_gen_steps,
-                (self.max_steps * abs(value)) / (np.max(timings) - np.min(timings)),
+    # function to write the route xml file
+    def write_route_file(self):
+        lines = ["<routes>"]
+        lines.append(
+            '    <vType id="%s" %s />'
+            % (
+                VEHICLE_TYPE_ID,
+                " ".join('%s="%s"' % item for item in VEHICLE_TYPE.items()),
+            )
+        )
+        for route_id, edges in ROUTES.items():
+            lines.append(
+                '    <route id="%s" edges="%s"/>' % (route_id, " ".join(edges))
             )
 
-        car_gen_steps = np.rint(car_gen_steps)
-
-        # writing the route xml file
-        with open("environment/episode_routes.rou.xml", "w") as routes:
-            print(
-                """<routes>
-            <vType accel="1.0" decel="4.5" id="standard_car" length="5.0" minGap="2.5" maxSpeed="25" sigma="0.5" />
-            <route id="W_N" edges="W2TL TL2N"/>
-            <route id="W_E" edges="W2TL TL2E"/>
-            <route id="W_S" edges="W2TL TL2S"/>
-            <route id="N_W" edges="N2TL TL2W"/>
-            <route id="N_E" edges="N2TL TL2E"/>
-            <route id="N_S" edges="N2TL TL2S"/>
-            <route id="E_W" edges="E2TL TL2W"/>
-            <route id="E_N" edges="E2TL TL2N"/>
-            <route id="E_S" edges="E2TL TL2S"/>
-            <route id="S_W" edges="S2TL TL2W"/>
-            <route id="S_N" edges="S2TL TL2N"/>
-            <route id="S_E" edges="S2TL TL2E"/>""",
-                file=routes,
+        for car_num, (route_id, step) in enumerate(
+            zip(self.car_routes, self.car_gen_steps)
+        ):
+            lines.append(
+                '<vehicle id="%s_%i" type="%s" route="%s" depart="%s" departLane="random" departSpeed="10" />'
+                % (route_id, car_num, VEHICLE_TYPE_ID, route_id, step)
             )
+        lines.append("</routes>")
+
+        with open(self.route_file, "w") as routes:
+            routes.write("\n".join(lines) + "\n")
+
+    # function to get the route options for the sumo command
+    def route_options(self):
+        if self.route_mode == "inject":
+            return ["--route-files", ""]
+        return ["--route-files", self.route_file]
+
+    # function to add the cars of the episode through traci
+    def inject_route(self, connection):
+        """
+        Define the vehicle type and the routes and add every car with its departure
+        time, sumo inserts them when their time comes
+        """
+        if self.route_mode != "inject":
+            return
+
+        connection.vehicletype.copy("DEFAULT_VEHTYPE", VEHICLE_TYPE_ID)
+        connection.vehicletype.setAccel(VEHICLE_TYPE_ID, VEHICLE_TYPE["accel"])
+        connection.vehicletype.setDecel(VEHICLE_TYPE_ID, VEHICLE_TYPE["decel"])
+        connection.vehicletype.setLength(VEHICLE_TYPE_ID, VEHICLE_TYPE["length"])
+        connection.vehicletype.setMinGap(VEHICLE_TYPE_ID, VEHICLE_TYPE["minGap"])
+        connection.vehicletype.setMaxSpeed(VEHICLE_TYPE_ID, VEHICLE_TYPE["maxSpeed"])
+        connection.vehicletype.setImperfection(VEHICLE_TYPE_ID, VEHICLE_TYPE["sigma"])
 
-            for car_num, step in enumerate(car_gen_steps):
-                str_or_turn_choice = np.random.uniform()
-                if str_or_turn_choice < 0.75:
-                    route_num = np.random.randint(1, 5)
-                    if route_num == 1:
-                        print(
-                            '<vehicle id="W_E_%i" type="standard_car" route="W_E" depart="%s" departLane="random" departSpeed="10" />'
-                            % (car_num, step),
-                            file=routes,
-                        )
-                    elif route_num == 2:
-                        print(
-                            '<vehicle id="N_S_%i" type="standard_car" route="N_S" depart="%s" departLane="random" departSpeed="10" />'
-                            % (car_num, step),
-                            file=routes,
-                        )
-                    elif route_num == 3:
-                        print(
-                            '<vehicle id="E_W_%i" type="standard_car" route="E_W" depart="%s" departLane="random" departSpeed="10" />'
-                            % (car_num, step),
-                            file=routes,
-                        )
-                    else:
-                        print(
-                            '<vehicle id="S_N_%i" type="standard_car" route="S_N" depart="%s" departLane="random" departSpeed="10" />'
-                            % (car_num, step),
-                            file=routes,
-                        )
-                else:
-                    route_num = np.random.randint(1, 9)
-                    if route_num == 1:
-                        print(
-                            '<vehicle id="W_N_%i" type="standard_car" route="W_N" depart="%s" departLane="random" departSpeed="10" />'
-                            % (car_num, step),
-                            file=routes,
-                        )
-                    elif route_num == 2:
-                        print(
-                            '<vehicle id="W_S_%i" type="standard_car" route="W_S" depart="%s" departLane="random" departSpeed="10" />'
-                            % (car_num, step),
-                            file=routes,
-                        )
-                    elif route_num == 3:
-                        print(
-                            '<vehicle id="E_N_%i" type="standard_car" route="E_N" depart="%s" departLane="random" departSpeed="10" />'
-                            % (car_num, step),
-                            file=routes,
-                        )
-                    elif route_num == 4:
-                        print(
-                            '<vehicle id="E_S_%i" type="standard_car" route="E_S" depart="%s" departLane="random" departSpeed="10" />'
-                            % (car_num, step),
-                            file=routes,
-                        )
-                    elif route_num == 5:
-                        print(
-                            '<vehicle id="N_W_%i" type="standard_car" route="N_W" depart="%s" departLane="random" departSpeed="10" />'
-                            % (car_num, step),
-                            file=routes,
-                        )
-                    elif route_num == 6:
-                        print(
-                            '<vehicle id="N_E_%i" type="standard_car" route="N_E" depart="%s" departLane="random" departSpeed="10" />'
-                            % (car_num, step),
-                            file=routes,
-                        )
-                    elif route_num == 7:
-                        print(
-                            '<vehicle id="S_W_%i" type="standard_car" route="S_W" depart="%s" departLane="random" departSpeed="10" />'
-                            % (car_num, step),
-                            file=routes,
-                        )
-                    else:
-                        print(
-                            '<vehicle id="S_E_%i" type="standard_car" route="S_E" depart="%s" departLane="random" departSpeed="10" />'
-                            % (car_num, step),
-                            file=routes,
-                        )
-
-            print("</routes>", file=routes)
+        for route_id, edges in ROUTES.items():
+            connection.route.add(route_id, edges)
+
+        for car_num, (route_id, step) in enumerate(
+            zip(self.car_routes, self.car_gen_steps)
+        ):
+            connection.vehicle.add(
+                "%s_%i" % (route_id, car_num),
+                route_id,
+                typeID=VEHICLE_TYPE_ID,
+                depart=str(step),
+                departLane="random",
+                departSpeed="10",
+            )
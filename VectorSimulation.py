@@ -0,0 +1,108 @@
+"""
+Several intersections stepped in lockstep by one agent
+"""
+import numpy as np
+import timeit
+
+from Rollout import create_simulation
+
+import warnings
+
+warnings.filterwarnings("ignore")
+
+
+# runs one episode on each of its simulations at the same time, the agent
+# chooses the actions of all of them with one batched prediction
+class VectorSimulation:
+    def __init__(self, envs, config, sumo_cmd, Model, Memory):
+        self.envs = envs
+        self.Model = Model
+        self.num_of_states = config["num_states"]
+        self.num_of_actions = config["num_actions"]
+
+        # every simulation has its own sumo instance and route file,
+        # the samples of all of them go into the same memory
+        self.simulations = [
+            create_simulation(config, sumo_cmd, "env_%d" % n, Model, Memory)
+            for n in range(envs)
+        ]
+
+    def run(self, simulation, first_episode, epsilons):
+        """
+        Run one episode per epsilon in lockstep and then train the agent on
+        the samples of all of them
+        """
+        simulation_time = self.run_episodes(first_episode, epsilons)
+
+        for env in self.simulations[: len(epsilons)]:
+            simulation.add_episode_stats(*env.get_episode_stats())
+
+        training_time = simulation.train(simulation.epochs * len(epsilons))
+
+        return simulation_time, training_time
+
+    # function to run the episodes of the simulations in lockstep
+    def run_episodes(self, first_episode, epsilons):
+        start_time = timeit.default_timer()
+
+        simulations = self.simulations[: len(epsilons)]
+        epsilons = np.asarray(epsilons)
+
+        for n, env in enumerate(simulations):
+            env.start_episode(first_episode + n)
+
+        states = self.reset_states(len(simulations))
+        active = np.ones(len(simulations), dtype=bool)
+
+        while active.any():
+            indices = np.flatnonzero(active)
+
+            for n in indices:
+                states[n] = simulations[n].observe()
+
+            actions = self.choose_actions(states[indices], epsilons[indices])
+            dones = self.step(simulations, indices, actions)
+            active[indices[dones]] = False
+
+        for env, epsilon in zip(simulations, epsilons):
+            env.end_episode(epsilon)
+
+        return round(timeit.default_timer() - start_time, 1)
+
+    # function to allocate the state array of the simulations
+    def reset_states(self, envs):
+        return np.zeros((envs, self.num_of_states))
+
+    # function to choose the actions of all simulations
+    def choose_actions(self, states, epsilons):
+        """
+        Explore or exploit for every row of states, the q values of all rows
+        come from one forward pass
+        """
+        q_values = self.Model.predict_batch(states)
+        actions = np.argmax(q_values, axis=1)
+
+        explore = np.random.random(len(states)) < epsilons
+        actions[explore] = np.random.randint(
+            0, self.num_of_actions, np.count_nonzero(explore)
+        )
+
+        return actions
+
+    # function to apply an action on each simulation
+    def step(self, simulations, indices, actions):
+        """
+        Run the actions and return which simulations reached the last step
+        """
+        dones = np.zeros(len(indices), dtype=bool)
+
+        for n, (index, action) in enumerate(zip(indices, actions)):
+            simulations[index].apply_action(int(action))
+            dones[n] = simulations[index].is_done()
+
+        return dones
+
+    # function to release the simulations, their sumo instances are closed
+    # at the end of every episode
+    def close(self):
+        self.simulations = []
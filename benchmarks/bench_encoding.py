@@ -0,0 +1,105 @@
+"""
+Micro-benchmark of the per-step occupancy state encoding
+
+run from the repository root with: python -m benchmarks.bench_encoding
+"""
+import timeit
+import numpy as np
+import traci.constants as tc
+
+from Observation import (
+    INCOMING_LANES,
+    LANE_LENGTH,
+    LANE_INDEX,
+    StateObserver,
+    encode_state,
+)
+
+NUM_STATES = 80
+VEHICLE_COUNTS = [100, 1000, 10000]
+REPEATS = 200
+
+
+# per-car if/elif encoding that get_state used before the vectorized encoder
+def loop_encode(vehicles):
+    state = np.zeros(NUM_STATES)
+
+    for car_data in vehicles.values():
+        lane_id = car_data[tc.VAR_LANE_ID]
+        lane_position = LANE_LENGTH - car_data[tc.VAR_LANEPOSITION]
+
+        if lane_position < 8:
+            cell_no = 0
+        elif lane_position < 16:
+            cell_no = 1
+        elif lane_position < 32:
+            cell_no = 2
+        elif lane_position < 64:
+            cell_no = 3
+        elif lane_position < 128:
+            cell_no = 4
+        elif lane_position < 256:
+            cell_no = 5
+        elif lane_position < 330:
+            cell_no = 6
+        elif lane_position < 500:
+            cell_no = 7
+        elif lane_position < 630:
+            cell_no = 8
+        else:
+            cell_no = 9
+
+        cell_prefix = LANE_INDEX.get(lane_id, -1)
+        if cell_prefix >= 0:
+            state[cell_prefix * 10 + cell_no] += 1
+
+    return state
+
+
+# function to get the state from the subscription results like LaneObserver does,
+# the lane id to cell prefix lookup is part of the timing
+def vector_encode(observer):
+    lane_indices, lane_positions = observer.get_lane_positions()
+    return encode_state(lane_indices, lane_positions, NUM_STATES)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    lanes = INCOMING_LANES + ["TL2N_0", ":TL_1_0"]
+
+    print("vehicles   loop (us/step)   vectorized (us/step)   speedup")
+    for n_cars in VEHICLE_COUNTS:
+        # both encoders start from the vehicle id -> subscribed values dict of a step
+        vehicle_ids = ["car_%d" % n for n in range(n_cars)]
+        lane_ids = rng.choice(lanes, n_cars)
+        lane_positions = rng.uniform(0.5, LANE_LENGTH, n_cars)
+        vehicles = {
+            vehicle_id: {
+                tc.VAR_LANE_ID: str(lane_id),
+                tc.VAR_LANEPOSITION: float(lane_position),
+            }
+            for vehicle_id, lane_id, lane_position in zip(
+                vehicle_ids, lane_ids, lane_positions
+            )
+        }
+        observer = StateObserver()
+        observer.vehicles = vehicles
+
+        assert np.array_equal(loop_encode(vehicles), vector_encode(observer))
+
+        loop_time = timeit.timeit(lambda: loop_encode(vehicles), number=REPEATS)
+        vector_time = timeit.timeit(lambda: vector_encode(observer), number=REPEATS)
+
+        print(
+            "%8d   %14.1f   %20.1f   %7.1fx"
+            % (
+                n_cars,
+                loop_time / REPEATS * 1e6,
+                vector_time / REPEATS * 1e6,
+                loop_time / vector_time,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Per-step cost of the training, test and timed signal episode loops on the surrogate,
+optionally next to the same loops of another checkout to show the engine adds no
+overhead
+
+run from the repository root with: python -m benchmarks.bench_engine
+compare with an older commit:
+    git worktree add /tmp/baseline <commit>
+    python -m benchmarks.bench_engine --baseline /tmp/baseline
+
+every case runs repeat times in each of the rounds and its fastest run is kept, with
+--null the simulator does not step so that only the cost of the loop is measured
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+
+CONFIG_FILE = "config_parameters.txt"
+SEED = 10000
+N_CARS = 1000
+
+MODES = ["train", "test", "base"]
+STEP_MODES = ["step", "fast_forward"]
+
+
+# connection that answers the calls of the episode loop without simulating, the
+# other calls such as the route injection go to the simulator
+class NullConnection:
+    def __init__(self, connection):
+        self._connection = connection
+        self.edge = NullEdgeDomain()
+        self.trafficlight = NullTrafficLightDomain()
+
+    def simulationStep(self, step=0):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+# edge subscriptions of an empty network
+class NullEdgeDomain:
+    def subscribe(self, edge_id, variables):
+        pass
+
+    def subscribeContext(self, edge_id, domain, dist, variables):
+        pass
+
+    def getContextSubscriptionResults(self, edge_id):
+        return {}
+
+    def getSubscriptionResults(self, edge_id):
+        import traci.constants as tc
+
+        return {tc.LAST_STEP_VEHICLE_HALTING_NUMBER: 0}
+
+
+class NullTrafficLightDomain:
+    def setPhase(self, tls_id, index):
+        pass
+
+
+# function to build the simulation of a mode with the modules of the checkout
+def create_case(mode, step_mode, config, sumo_cmd):
+    from Traffic import TrafficGenerator
+
+    traffic_gen = TrafficGenerator(
+        config["max_steps"],
+        N_CARS,
+        os.path.join("environment", "episode_routes_bench.rou.xml"),
+        config["route_mode"],
+    )
+    telemetry_path = tempfile.mkdtemp(prefix="bench_engine_")
+    arguments = (
+        config["max_steps"],
+        config["green_duration"],
+        config["yellow_duration"],
+    )
+
+    if mode == "base":
+        from BaseSimulation import BaseSimulation
+
+        simulation = BaseSimulation(
+            traffic_gen,
+            sumo_cmd,
+            *arguments,
+            "bench",
+            config["queue_edges"],
+            step_mode,
+            telemetry_path,
+        )
+        return lambda: simulation.run_signal(SEED)
+
+    from Policy import PolicyRuntime
+
+    policy = PolicyRuntime(config["num_states"], config["models_path_name"])
+
+    if mode == "test":
+        from TestSimulation import TestSimulation
+
+        simulation = TestSimulation(
+            policy,
+            traffic_gen,
+            sumo_cmd,
+            *arguments,
+            config["num_states"],
+            config["num_actions"],
+            "bench",
+            config["queue_edges"],
+            step_mode,
+            telemetry_path,
+        )
+        return lambda: simulation.run_test(SEED)
+
+    from Memory import Memory
+    from Simulation import Simulation
+
+    simulation = Simulation(
+        policy,
+        Memory(config["memory_size_min"], config["memory_size_max"]),
+        traffic_gen,
+        sumo_cmd,
+        config["gamma"],
+        *arguments,
+        config["num_states"],
+        config["num_actions"],
+        config["epochs"],
+        "bench",
+        config["queue_edges"],
+        step_mode,
+    )
+    return lambda: simulation.run_episode(SEED, 0.5)
+
+
+# function to time every case with the modules of a checkout, called in a fresh
+# interpreter so that the modules of different checkouts do not mix
+def run_cases(repeat, max_steps, null):
+    import Tools
+    from Tools import set_config, set_sumo
+
+    if null:
+        Tools.connection_hooks.append(NullConnection)
+
+    config = set_config(CONFIG_FILE)
+    config["max_steps"] = max_steps
+    sumo_cmd = set_sumo(0, config["sumocfg_file_name"], max_steps, "surrogate")
+
+    results = []
+    for mode in MODES:
+        for step_mode in STEP_MODES:
+            run = create_case(mode, step_mode, config, sumo_cmd)
+
+            times = []
+            for n in range(repeat):
+                start_time = timeit.default_timer()
+                run()
+                times.append(timeit.default_timer() - start_time)
+
+            results.append(
+                {
+                    "mode": mode,
+                    "step_mode": step_mode,
+                    "us_per_step": round(min(times) / max_steps * 1e6, 2),
+                }
+            )
+
+    return results
+
+
+# function to run the cases of a checkout in a child process
+def run_child(path, repeat, max_steps, null):
+    result = subprocess.run(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--child",
+            os.path.abspath(path),
+            str(repeat),
+            str(max_steps),
+            str(int(null)),
+        ],
+        capture_output=True,
+        text=True,
+        cwd=path,
+    )
+    if result.returncode != 0:
+        sys.exit(result.stderr.strip())
+
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# function to keep the fastest run of every case over several rounds
+def fastest(rounds):
+    return [
+        min(cases, key=lambda result: result["us_per_step"]) for cases in zip(*rounds)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="episode loop benchmark")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--max-steps", dest="max_steps", type=int, default=3000)
+    parser.add_argument("--null", action="store_true")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--child", nargs=4, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        path, repeat, max_steps, null = args.child
+        sys.path.insert(0, path)
+        # the episodes print their stats, only the results go to stdout
+        stdout = sys.stdout
+        sys.stdout = sys.stderr
+        results = run_cases(int(repeat), int(max_steps), null == "1")
+        sys.stdout = stdout
+        print(json.dumps(results))
+        return
+
+    # the checkouts take turns so that a slower period of the machine hits both
+    rounds = []
+    baseline_rounds = []
+    for n in range(args.rounds):
+        rounds.append(run_child(".", args.repeat, args.max_steps, args.null))
+        if args.baseline:
+            baseline_rounds.append(
+                run_child(args.baseline, args.repeat, args.max_steps, args.null)
+            )
+
+    results = fastest(rounds)
+    baseline = fastest(baseline_rounds) if args.baseline else None
+
+    print("%-6s %-13s %14s %14s %8s" % ("mode", "step mode", "us/step", "baseline", ""))
+    for n, result in enumerate(results):
+        line = "%-6s %-13s %14.2f" % (
+            result["mode"],
+            result["step_mode"],
+            result["us_per_step"],
+        )
+        if baseline is not None:
+            old_value = baseline[n]["us_per_step"]
+            line += " %14.2f %+7.1f%%" % (
+                old_value,
+                (result["us_per_step"] / old_value - 1) * 100,
+            )
+        print(line)
+
+    output = args.output
+    if output is None:
+        os.makedirs(os.path.join("benchmarks", "results"), exist_ok=True)
+        output = os.path.join("benchmarks", "results", "engine.json")
+
+    with open(output, "w") as output_file:
+        json.dump(
+            {
+                "seed": SEED,
+                "n_cars_generated": N_CARS,
+                "max_steps": args.max_steps,
+                "null": args.null,
+                "results": results,
+                "baseline": baseline,
+            },
+            output_file,
+            indent=1,
+        )
+    print("Results saved at ", output)
+
+
+if __name__ == "__main__":
+    main()
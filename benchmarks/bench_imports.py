@@ -0,0 +1,153 @@
+"""
+Import time benchmark of every mode of Main.py, measured with python -X importtime
+in a fresh interpreter, and check that no mode loads the heavy modules it does not use
+
+run from the repository root with: python -m benchmarks.bench_imports
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MAIN_FILE = "Main.py"
+
+# function of Main.py that runs each mode, and the modules imported by its branches
+# that are not always taken, such as the keras or numpy policy of the test
+CASES = {
+    "1 train": ("train_model", []),
+    "2 test keras": ("test_model", ["from Model import TestModel"]),
+    "2 test numpy": ("test_model", ["from Policy import PolicyRuntime"]),
+    "2 evaluate": ("test_model", ["from Evaluation import EvaluationPool"]),
+    "4 base": ("base_model", []),
+    "5 export": ("export_model", []),
+}
+
+# heavy top level modules a case must not load before it needs them,
+# matplotlib is only loaded when the first plot is saved
+FORBIDDEN = {
+    "1 train": ["matplotlib"],
+    "2 test keras": ["matplotlib"],
+    "2 test numpy": ["keras", "tensorflow", "matplotlib"],
+    "2 evaluate": ["matplotlib"],
+    "4 base": ["keras", "tensorflow", "matplotlib"],
+    "5 export": ["keras", "tensorflow", "matplotlib", "traci", "sumolib"],
+}
+
+
+# function to get the import statements a mode runs when it starts
+def mode_imports(function_name, extra_imports):
+    """
+    The imports at the top of the function body in Main.py, so that the benchmark
+    follows the code instead of a copy of it
+    """
+    with open(MAIN_FILE) as main_file:
+        tree = ast.parse(main_file.read())
+
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == function_name:
+            imports = [
+                ast.unparse(statement)
+                for statement in node.body
+                if isinstance(statement, (ast.Import, ast.ImportFrom))
+            ]
+            return ["import Main"] + imports + extra_imports
+
+    sys.exit("Function %s not found in %s" % (function_name, MAIN_FILE))
+
+
+# function to import the modules of a case in a fresh interpreter
+def measure(imports):
+    """
+    Return the total import time in ms and the top level modules that were loaded
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "\n".join(imports)],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    total = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line[len("import time:") :].split("|")
+        modules.add(name.strip().split(".")[0])
+        # modules imported by another one are indented
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+
+    return total / 1000, modules
+
+
+# function to run a case several times and check the modules it loaded
+def run_case(case, repeat):
+    function_name, extra_imports = CASES[case]
+    imports = mode_imports(function_name, extra_imports)
+
+    try:
+        times = []
+        for n in range(repeat):
+            import_time, modules = measure(imports)
+            times.append(import_time)
+    except RuntimeError as error:
+        return {"case": case, "error": str(error)}
+
+    loaded = sorted(set(FORBIDDEN[case]) & modules)
+
+    return {
+        "case": case,
+        "import_ms": round(statistics.median(times), 1),
+        "min_ms": round(min(times), 1),
+        "forbidden_loaded": loaded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import time benchmark")
+    parser.add_argument("--cases", nargs="+", default=list(CASES), choices=list(CASES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    results = []
+    failed = False
+
+    print("%-14s %12s %12s  %s" % ("case", "median ms", "min ms", "check"))
+    for case in args.cases:
+        result = run_case(case, args.repeat)
+        results.append(result)
+
+        if "error" in result:
+            print("%-14s failed: %s" % (case, result["error"]))
+        else:
+            check = "ok"
+            if result["forbidden_loaded"]:
+                check = "loads " + ", ".join(result["forbidden_loaded"])
+                failed = True
+            print(
+                "%-14s %12.1f %12.1f  %s"
+                % (case, result["import_ms"], result["min_ms"], check)
+            )
+
+    output = args.output
+    if output is None:
+        os.makedirs(os.path.join("benchmarks", "results"), exist_ok=True)
+        output = os.path.join("benchmarks", "results", "imports.json")
+
+    with open(output, "w") as output_file:
+        json.dump({"python": sys.version.split()[0], "results": results}, output_file)
+    print("Results saved at ", output)
+
+    if failed:
+        sys.exit("A mode loads modules it does not use")
+
+
+if __name__ == "__main__":
+    main()
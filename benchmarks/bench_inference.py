@@ -0,0 +1,72 @@
+"""
+Per-decision latency of the predict_single inference paths
+
+run from the repository root with: python -m benchmarks.bench_inference
+"""
+import timeit
+import numpy as np
+
+from Policy import DenseForward
+
+NUM_STATES = 80
+NUM_ACTIONS = 4
+HIDDEN_UNITS = 200
+HIDDEN_LAYERS = 4
+DECISIONS = 2000
+WARMUP = 50
+
+
+# random weights with the shape of the 4x200 dense network
+def random_weights(rng):
+    sizes = [NUM_STATES] + [HIDDEN_UNITS] * HIDDEN_LAYERS + [NUM_ACTIONS]
+    weights = []
+    for n_in, n_out in zip(sizes[:-1], sizes[1:]):
+        weights.append(rng.normal(0, 0.1, (n_in, n_out)))
+        weights.append(np.zeros(n_out))
+    return weights
+
+
+# function to time every call of predict_single
+def measure(predict_single, states):
+    for state in states[:WARMUP]:
+        predict_single(state)
+
+    latencies = np.empty(len(states))
+    for i, state in enumerate(states):
+        start = timeit.default_timer()
+        predict_single(state)
+        latencies[i] = timeit.default_timer() - start
+
+    return latencies * 1e6
+
+
+def report(name, latencies):
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    print(
+        "%-8s  p50 %9.1f us   p90 %9.1f us   p99 %9.1f us   max %9.1f us"
+        % (name, p50, p90, p99, latencies.max())
+    )
+
+
+def main():
+    rng = np.random.default_rng(0)
+    states = rng.integers(0, 10, (DECISIONS, NUM_STATES)).astype(np.float64)
+
+    try:
+        from Model import TrainingModel
+    except ImportError:
+        # without keras only the numpy path can be measured
+        forward = DenseForward(random_weights(rng))
+        report(
+            "numpy",
+            measure(lambda s: forward.predict(np.reshape(s, [1, NUM_STATES])), states),
+        )
+        return
+
+    for inference in ["predict", "direct", "numpy"]:
+        model = TrainingModel(NUM_STATES, NUM_ACTIONS, 200, 0.001, inference)
+        report(inference, measure(model.predict_single, states))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+End-to-end benchmark of the dqn training, test and fixed-time pipelines on fixed
+demand scenarios, the results are saved as json so that two commits can be compared
+
+run from the repository root with: python -m benchmarks.bench_pipelines
+compare two result files with: python -m benchmarks.bench_pipelines --compare a.json b.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+CONFIG_FILE = "config_parameters.txt"
+SEED = 10000
+
+# number of cars generated in one episode of each scenario
+SCENARIOS = {"low": 500, "medium": 1000, "saturated": 3000}
+MODES = ["dqn", "test", "base"]
+
+# metrics printed by --compare, a higher throughput and a lower cost are better
+THROUGHPUT_METRICS = ["steps_per_sec", "decisions_per_sec", "replay_updates_per_sec"]
+COST_METRICS = ["episode_wall_time", "peak_rss_mb"]
+
+
+# function to pick sumo if it is installed, otherwise the surrogate
+def detect_backend():
+    sumo_home = os.environ.get("SUMO_HOME", "")
+    if os.path.isfile(os.path.join(sumo_home, "bin", "sumo")):
+        return "sumo"
+    return "surrogate"
+
+
+# function to run one mode on one scenario, called in a fresh interpreter
+def run_case(mode, scenario, backend, max_steps):
+    from Tools import set_config, set_sumo
+    from Traffic import TrafficGenerator
+
+    config = set_config(CONFIG_FILE)
+    if max_steps:
+        config["max_steps"] = max_steps
+
+    sumo_cmd = set_sumo(0, config["sumocfg_file_name"], config["max_steps"], backend)
+    traffic_gen = TrafficGenerator(
+        config["max_steps"],
+        SCENARIOS[scenario],
+        os.path.join("environment", "episode_routes_bench.rou.xml"),
+        config["route_mode"],
+    )
+    telemetry_path = tempfile.mkdtemp(prefix="bench_telemetry_")
+    replay_updates = 0
+    training_time = 0.0
+
+    start_time = timeit.default_timer()
+
+    # the exploration and the replay batches draw from random, the weights of the
+    # model from the keras generators
+    random.seed(SEED)
+
+    if mode == "dqn":
+        import keras
+        from Model import TrainingModel
+        from Memory import create_memory
+        from Simulation import Simulation
+
+        keras.utils.set_random_seed(SEED)
+        model = TrainingModel(
+            config["num_states"],
+            config["num_actions"],
+            config["batch_size"],
+            config["learning_rate"],
+            config["inference"],
+        )
+        simulation = Simulation(
+            model,
+            create_memory(config),
+            traffic_gen,
+            sumo_cmd,
+            config["gamma"],
+            config["max_steps"],
+            config["green_duration"],
+            config["yellow_duration"],
+            config["num_states"],
+            config["num_actions"],
+            config["epochs"],
+            "bench",
+            config["queue_edges"],
+            config["step_mode"],
+        )
+        start_time = timeit.default_timer()
+        simulation_time = simulation.run_episode(SEED, 0.5)
+        steps = simulation.step_count
+        decisions = simulation.num_step
+
+        # count the replays that trained the model
+        train_model = model.train_model
+
+        def counted_train_model(*args):
+            nonlocal replay_updates
+            replay_updates += 1
+            train_model(*args)
+
+        model.train_model = counted_train_model
+        training_time = simulation.train(config["epochs"])
+    else:
+        if mode == "test":
+            from Policy import PolicyRuntime
+            from TestSimulation import TestSimulation
+
+            simulation = TestSimulation(
+                PolicyRuntime(config["num_states"], config["models_path_name"]),
+                traffic_gen,
+                sumo_cmd,
+                config["max_steps"],
+                config["green_duration"],
+                config["yellow_duration"],
+                config["num_states"],
+                config["num_actions"],
+                "bench",
+                config["queue_edges"],
+                config["step_mode"],
+                telemetry_path,
+            )
+            simulation.run_test(SEED)
+        else:
+            from BaseSimulation import BaseSimulation
+
+            simulation = BaseSimulation(
+                traffic_gen,
+                sumo_cmd,
+                config["max_steps"],
+                config["green_duration"],
+                config["yellow_duration"],
+                "bench",
+                config["queue_edges"],
+                config["step_mode"],
+                telemetry_path,
+            )
+            simulation.run_signal(SEED)
+
+        simulation_time = timeit.default_timer() - start_time
+        steps = simulation.step_count
+        decisions = len(simulation.telemetry.read("decisions", "step"))
+
+    wall_time = timeit.default_timer() - start_time
+
+    return {
+        "mode": mode,
+        "scenario": scenario,
+        "n_cars_generated": SCENARIOS[scenario],
+        "steps": steps,
+        "decisions": decisions,
+        "replay_updates": replay_updates,
+        "episode_wall_time": round(wall_time, 3),
+        "simulation_time": round(simulation_time, 3),
+        "training_time": round(training_time, 3),
+        "steps_per_sec": round(steps / max(simulation_time, 1e-9), 1),
+        "decisions_per_sec": round(decisions / max(simulation_time, 1e-9), 1),
+        "replay_updates_per_sec": round(replay_updates / max(training_time, 1e-9), 1),
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+# function to run a case in a child process so that its peak memory is its own
+def run_child(mode, scenario, backend, max_steps):
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.bench_pipelines",
+            "--child",
+            mode,
+            scenario,
+            backend,
+            str(max_steps),
+        ],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines() or ["exit %d" % result.returncode]
+        return {"mode": mode, "scenario": scenario, "error": error[-1]}
+
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# function to get the commit the benchmark ran on
+def git_commit():
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+    )
+    return result.stdout.strip() or None
+
+
+# function to print the change of every metric between two result files
+def compare(old_file, new_file):
+    with open(old_file) as old, open(new_file) as new:
+        old_results, new_results = json.load(old), json.load(new)
+
+    old_cases = {(r["mode"], r["scenario"]): r for r in old_results["results"]}
+    print(
+        "comparing %s (%s) with %s (%s)"
+        % (old_file, old_results["commit"], new_file, new_results["commit"])
+    )
+    print(
+        "%-5s %-10s %-24s %12s %12s %8s"
+        % ("mode", "scenario", "metric", "old", "new", "change")
+    )
+    for case in new_results["results"]:
+        old_case = old_cases.get((case["mode"], case["scenario"]))
+        if old_case is None or "error" in case or "error" in old_case:
+            continue
+
+        for metric in THROUGHPUT_METRICS + COST_METRICS:
+            old_value, new_value = old_case[metric], case[metric]
+            change = (new_value / old_value - 1) * 100 if old_value else 0.0
+            print(
+                "%-5s %-10s %-24s %12.1f %12.1f %+7.1f%%"
+                % (case["mode"], case["scenario"], metric, old_value, new_value, change)
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pipeline benchmark")
+    parser.add_argument(
+        "--backend", default="auto", choices=["auto", "sumo", "surrogate"]
+    )
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument(
+        "--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS)
+    )
+    parser.add_argument("--max-steps", dest="max_steps", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", nargs=2, default=None)
+    parser.add_argument("--child", nargs=4, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, scenario, backend, max_steps = args.child
+        print(json.dumps(run_case(mode, scenario, backend, int(max_steps))))
+        return
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    backend = detect_backend() if args.backend == "auto" else args.backend
+    commit = git_commit()
+    results = []
+
+    print("backend:", backend)
+    for mode in args.modes:
+        for scenario in args.scenarios:
+            result = run_child(mode, scenario, backend, args.max_steps)
+            results.append(result)
+            if "error" in result:
+                print("%-5s %-10s failed: %s" % (mode, scenario, result["error"]))
+            else:
+                print(
+                    "%-5s %-10s %8.1f steps/s %7.1f decisions/s %8.1f updates/s "
+                    "%7.2f s %7.1f MB"
+                    % (
+                        mode,
+                        scenario,
+                        result["steps_per_sec"],
+                        result["decisions_per_sec"],
+                        result["replay_updates_per_sec"],
+                        result["episode_wall_time"],
+                        result["peak_rss_mb"],
+                    )
+                )
+
+    output = args.output
+    if output is None:
+        os.makedirs(os.path.join("benchmarks", "results"), exist_ok=True)
+        output = os.path.join(
+            "benchmarks", "results", "pipelines_%s_%s.json" % (commit, backend)
+        )
+
+    with open(output, "w") as output_file:
+        json.dump(
+            {
+                "commit": commit,
+                "backend": backend,
+                "seed": SEED,
+                "python": platform.python_version(),
+                "created": datetime.now().strftime("%Y%m%d_%H%M%S"),
+                "results": results,
+            },
+            output_file,
+            indent=1,
+        )
+    print("Results saved at ", output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Startup time and memory footprint of the keras and numpy policy paths
+
+run from the repository root with: python -m benchmarks.bench_runtime
+"""
+import subprocess
+import sys
+
+MODEL_PATH = "Models"
+
+# each path is loaded in a fresh interpreter so imports are not shared
+LOADERS = {
+    "keras": "from Model import TestModel\n"
+    "policy = TestModel(80, %r)\n" % MODEL_PATH,
+    "numpy": "from Policy import PolicyRuntime\n"
+    "policy = PolicyRuntime(80, %r)\n" % MODEL_PATH,
+}
+
+CHILD = """
+import resource
+import timeit
+start = timeit.default_timer()
+%s
+import numpy as np
+policy.predict_single(np.zeros(80))
+elapsed = timeit.default_timer() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def main():
+    print("runtime   startup (s)   peak RSS (MB)")
+    for name, loader in LOADERS.items():
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD % loader], capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            print("%-8s  failed: %s" % (name, result.stderr.strip().splitlines()[-1]))
+            continue
+
+        elapsed, max_rss = result.stdout.split()[-2:]
+        print("%-8s  %11.2f   %13.1f" % (name, float(elapsed), int(max_rss) / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Replay memory against a deque of the same length holding the raw samples
+"""
+import random
+from collections import deque
+import numpy as np
+
+from Memory import Memory
+
+import warnings
+
+warnings.filterwarnings("ignore")
+
+
+# function to play episodes whose states repeat, so that the memory stores some
+# states once for several samples
+def play(memory, reference, writes, n_samples, episode_length, n_states, seed):
+    generator = random.Random(seed)
+    # a cell of the state holds at most a few dozen cars
+    states = [
+        np.array([value % 50, value // 50, 0, 1], dtype=np.float64)
+        for value in range(n_states)
+    ]
+
+    state = states[0]
+    for n in range(n_samples):
+        if n % episode_length == 0:
+            # every episode starts from the empty intersection
+            state = states[0]
+
+        next_state = states[generator.randrange(n_states)]
+        sample = (state, generator.randrange(4), float(n), next_state)
+        writes.append(memory.state_writes)
+        memory.add_sample(sample)
+        reference.append(sample)
+        state = next_state
+
+        yield n
+
+
+# function to check that the memory holds the newest samples of the reference
+def check(memory, reference, writes):
+    """
+    The store keeps the states of the newest samples that wrote at most max_size
+    states, the samples that wrote their state as well can evict older ones
+    """
+    kept = 0
+    while (
+        kept < len(reference)
+        and memory.state_writes - writes[-kept - 1] <= memory.max_size
+    ):
+        kept += 1
+    assert kept <= memory.current_size() <= len(reference)
+
+    states, actions, rewards, next_states = memory.gather(
+        memory.positions(np.arange(memory.current_size()))
+    )
+    newest = list(reference)[len(reference) - memory.current_size() :]
+    for n, (state, action, reward, next_state) in enumerate(newest):
+        assert np.array_equal(states[n], state)
+        assert actions[n] == action
+        assert rewards[n] == reward
+        assert np.array_equal(next_states[n], next_state)
+
+
+def test_memory_is_full_before_evicting():
+    memory = Memory(0, 50)
+    reference = deque(maxlen=50)
+    writes = []
+    for n in play(memory, reference, writes, 59, 20, 1000, 0):
+        pass
+
+    assert memory.current_size() == 50
+    check(memory, reference, writes)
+
+
+def test_memory_matches_reference():
+    for max_size in [1, 5, 50, 300]:
+        for n_states in [1, 3, 200]:
+            memory = Memory(0, max_size)
+            reference = deque(maxlen=max_size)
+            writes = []
+            for n in play(
+                memory, reference, writes, 5 * max_size + 100, 20, n_states, 1
+            ):
+                if n % (max_size // 50 + 1) == 0:
+                    check(memory, reference, writes)
+
+
+def test_memory_evicts_only_for_episode_starts():
+    memory = Memory(0, 300)
+    reference = deque(maxlen=300)
+    writes = []
+    for n in play(memory, reference, writes, 1500, 20, 1000, 2):
+        pass
+
+    # the first sample of each episode writes one extra state
+    assert memory.current_size() >= 300 - 300 // 20
+    check(memory, reference, writes)